@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+MIN_PROBABILITY = 0.05 # Every operator keeps at least this chance of being picked
+ADAPTATION_RATE = 0.02 # Weight of the latest outcome in an operator's success rate
+STAGNATION_SCALE = 10 # Generations without improvement over which mutation gets one step more intense
+
+class OperatorControl(object):
+    """
+    Adapts mutation during a run. Each mutation operator gets picked with a
+    probability matching its recent success rate at producing children
+    better than their parents, never going below min_probability. The
+    chance and the number of mutations per child grow the longer the best
+    score stagnates, back to the initial ones once it improves.
+    """
+    def __init__(self, operators, n_mutations, p_mutation, max_n_mutations = None, max_p_mutation = 1.0,
+                 min_probability = MIN_PROBABILITY, adaptation_rate = ADAPTATION_RATE,
+                 stagnation_scale = STAGNATION_SCALE):
+        self.operators = list(operators)
+        self.base_n_mutations = n_mutations
+        self.base_p_mutation = p_mutation
+        self.max_n_mutations = max_n_mutations or 2 * n_mutations
+        self.max_p_mutation = max_p_mutation
+        self.min_probability = min_probability
+        self.adaptation_rate = adaptation_rate
+        self.stagnation_scale = stagnation_scale
+        self.reset()
+
+    def reset(self):
+        n = len(self.operators)
+        self.quality = [1.0 / n] * n
+        self.uses = [0] * n
+        self.improvements = [0] * n
+        self.stagnation = 0
+
+    @property
+    def probabilities(self):
+        total = sum(self.quality)
+        n = len(self.operators)
+
+        if total <= 0:
+            return [1.0 / n] * n
+
+        scale = 1 - n * self.min_probability
+        return [self.min_probability + scale * q / total for q in self.quality]
+
+    @property
+    def n_mutations(self):
+        return min(self.max_n_mutations, self.base_n_mutations + self.stagnation // self.stagnation_scale)
+
+    @property
+    def p_mutation(self):
+        steps = float(self.stagnation) / self.stagnation_scale
+        return min(self.max_p_mutation, self.base_p_mutation * (1 + steps))
+
+    def mutation_options(self):
+        """
+        Keyword arguments for an instance's mutate.
+        """
+        return {'weights' : self.probabilities, 'n_mutations' : self.n_mutations, 'p_mutation' : self.p_mutation}
+
+    def credit(self, applied, improved):
+        """
+        Records that a child made with the applied operators (indices into
+        operators) did or did not improve on its parents.
+        """
+        reward = 1.0 if improved else 0.0
+
+        for k in applied:
+            self.uses[k] += 1
+            self.improvements[k] += improved
+            self.quality[k] += self.adaptation_rate * (reward - self.quality[k])
+
+    def update(self, improved):
+        """
+        Records a generation, and whether it improved the best score.
+        """
+        self.stagnation = 0 if improved else self.stagnation + 1
+
+    def stats(self):
+        probabilities = self.probabilities
+        operators = {}
+
+        for k, name in enumerate(self.operators):
+            operators[name] = {'uses' : self.uses[k], 'improvements' : self.improvements[k],
+                               'probability' : probabilities[k]}
+
+        return {'operators' : operators, 'n_mutations' : self.n_mutations, 'p_mutation' : self.p_mutation}
+
+    def get_state(self):
+        return (list(self.quality), list(self.uses), list(self.improvements), self.stagnation)
+
+    def set_state(self, state):
+        quality, uses, improvements, self.stagnation = state
+        self.quality, self.uses, self.improvements = list(quality), list(uses), list(improvements)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import hashlib
+import numpy as np
+from glob import glob
+from Checkpoint import atomic_write
+from GABase import PopulationGenerator
+from GAImpl import ScheduleEvaluator, ScheduleInstance
+from Problem import OFF
+
+ARCHIVE_DIR = 'solutions'
+SEED_FRACTION = 0.2 # Of a population taken as is from the best archived schedules
+PERTURBED_FRACTION = 0.3 # Of a population made of archived schedules mutated a bit
+N_PERTURBATIONS = 10 # Mutations made to each perturbed copy
+
+ARCHIVED_NAME = re.compile(r'-(\d+)-([0-9a-f]{32})-[0-9a-f]{8}\.txt$') # The score and fingerprint of a saved schedule
+
+def problem_fingerprint(problem):
+    """
+    A digest of what a problem compiles to, telling apart the instances
+    schedules were made for.
+    """
+    digest = hashlib.md5('\t'.join(problem.shift_names))
+
+    for name, value in sorted(vars(problem).iteritems()):
+        if isinstance(value, np.ndarray):
+            digest.update(name)
+            digest.update(str(value.shape))
+            digest.update(np.ascontiguousarray(value).tobytes())
+
+    return digest.hexdigest()
+
+def read_schedule(path):
+    """
+    The instance fingerprint and score of a saved schedule, as given by its
+    file name, both None for files not named by the archive, and its rows
+    of shift names.
+    """
+    with open(path, 'r') as fp:
+        lines = fp.read().split('\n')
+
+    match = ARCHIVED_NAME.search(os.path.basename(path))
+    fingerprint, score = (match.group(2), int(match.group(1))) if match else (None, None)
+
+    return fingerprint, score, [line.rstrip('\r').split('\t') for line in lines if line.strip()]
+
+class SolutionArchive(object):
+    """
+    The schedules saved to a directory, by the fingerprint of the instance
+    they were made for, kept in their file names. Files not named with one,
+    as saved before there was an archive, count for any instance whose
+    shifts and size they fit.
+    """
+    def __init__(self, directory = ARCHIVE_DIR, extra_paths = ()):
+        self.directory = directory
+        self.extra_paths = list(extra_paths) # Read but never written to
+
+    def schedules(self, problem, evaluator = None):
+        """
+        (score, matrix) pairs of the distinct schedules for the problem, best
+        first, scored by the evaluator.
+        """
+        fingerprint = problem_fingerprint(problem)
+        evaluator = evaluator or ScheduleEvaluator(problem, 0)
+        n_empl, n_days = len(problem.employees), problem.days
+        found = {}
+
+        for path in sorted(glob(os.path.join(self.directory, '*.txt'))) + self.extra_paths:
+            try:
+                saved_for, score, rows = read_schedule(path)
+            except (IOError, ValueError):
+                continue
+
+            if saved_for not in (None, fingerprint) or len(rows) != n_empl:
+                continue
+
+            # Rows of older files may be missing their trailing days off
+            if any(len(row) > n_days or any(name not in problem.shift_codes for name in row) for row in rows):
+                continue
+
+            matrix = np.full((n_empl, n_days), OFF, dtype=np.int8)
+
+            for i, row in enumerate(rows):
+                matrix[i, :len(row)] = [problem.shift_codes[name] for name in row]
+
+            found.setdefault(matrix.tobytes(), matrix)
+
+        if not found:
+            return []
+
+        matrices = found.values()
+        template = ScheduleInstance(0, [], [shift.name for shift in problem.shifts])
+        scores = evaluator.evaluate_population([template._derive(matrix) for matrix in matrices])
+
+        return sorted(zip(scores, matrices), key=lambda x: x[0])
+
+    def save(self, problem, solution, score, name = 'res'):
+        """
+        Atomically writes the schedule, in the same plain format as ever,
+        under a name made of its score, the fingerprint of the instance and
+        a hash of the schedule, so that neither other schedules of the same
+        score nor ones for other instances get overwritten. Returns its path.
+        """
+        fingerprint = problem_fingerprint(problem)
+        content = hashlib.md5(solution._matrix.tobytes()).hexdigest()
+        path = os.path.join(self.directory, '{0}-{1}-{2}-{3}.txt'.format(name, score, fingerprint, content[:8]))
+
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            if not os.path.isdir(self.directory): # Rather than made by another worker just now
+                raise
+
+        atomic_write(path, str(solution))
+
+        return path
+
+class SeededPopulationGenerator(PopulationGenerator):
+    """
+    Starts populations from archived schedules: seed_fraction of them the
+    best schedules as they are, perturbed_fraction copies of those with
+    n_perturbations mutations each, and the rest from the given generator.
+    """
+    def __init__(self, generator, schedules, seed_fraction = SEED_FRACTION,
+                 perturbed_fraction = PERTURBED_FRACTION, n_perturbations = N_PERTURBATIONS):
+        self._generator = generator
+        self._schedules = [matrix for score, matrix in schedules]
+        self.seed_fraction = seed_fraction
+        self.perturbed_fraction = perturbed_fraction
+        self.n_perturbations = n_perturbations
+
+    def unpack_population(self, packed):
+        return self._generator.unpack_population(packed)
+
+    def generate_population(self, size):
+        n_seeds = min(len(self._schedules), int(round(size * self.seed_fraction)))
+        seeds = self._generator.unpack_population(self._schedules[:n_seeds]) if n_seeds else []
+        pops = list(seeds)
+
+        if seeds:
+            for k in xrange(int(round(size * self.perturbed_fraction))):
+                pops.append(seeds[k % n_seeds].mutate(n_mutations=self.n_perturbations, p_mutation=1.0))
+
+        pops = pops[:size]
+
+        return pops + self._generator.generate_population(size - len(pops))
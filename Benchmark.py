@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import shutil
+import platform
+import tempfile
+import argparse
+import random
+import numpy as np
+from time import time
+from Parser import Parser
+from GABase import GeneticAlgorithm
+from GAImpl import ScheduleEvaluator, MixedPopulationGenerator
+import InstanceGenerator
+
+SEED = 0
+REPEAT = 3 # Best of this many timings is kept
+POP_SIZE = 50
+N_OPS = 200 # Operations timed per repeat, for the per operation figures
+GA_ITERATIONS = 10
+SCALES = [(2, 1), (1, 2), (4, 2)] # (employees, days) multiples of instance.txt
+SYNTHETIC = [(100, 364, 20)] # (employees, days, shifts) of generated instances
+TOLERANCE = 0.2 # Slowdown over the baseline reported as a regression
+
+def read_sections(path):
+    """
+    The data lines of each SECTION_* of an instance file, by header.
+    """
+    sections = {}
+    lines = None
+
+    with open(path, 'r') as fp:
+        for line in fp:
+            line = line.strip()
+
+            if not line or line[0] == '#':
+                continue
+
+            if line.startswith('SECTION_'):
+                lines = sections.setdefault(line, [])
+            elif lines is not None:
+                lines.append(line)
+
+    return sections
+
+def scale_instance(path, out_path, employees = 1, days = 1):
+    """
+    Writes an instance with every employee copied employees times and the
+    horizon repeated days times, with cover requirements to match. Horizons
+    are whole weeks, so the copies keep their weekdays.
+    """
+    sections = read_sections(path)
+    n_days = int(sections['SECTION_HORIZON'][0])
+
+    def copies(name):
+        return [(name if k == 0 else '{0}_{1}'.format(name, k)) for k in xrange(employees)]
+
+    def shifted(day):
+        return [int(day) + t * n_days for t in xrange(days)]
+
+    staff = []
+
+    for line in sections['SECTION_STAFF']:
+        parts = line.split(',')
+        max_shifts = '|'.join('{0}={1}'.format(shift, int(limit) * days) for shift, limit in
+                              (pair.split('=') for pair in parts[1].split('|')))
+        rest = [int(parts[2]) * days, int(parts[3]) * days] + parts[4:7] + [int(parts[7]) * days]
+
+        for name in copies(parts[0]):
+            staff.append(','.join([name, max_shifts] + [str(x) for x in rest]))
+
+    days_off = []
+
+    for line in sections['SECTION_DAYS_OFF']:
+        parts = line.split(',')
+        off = [str(day) for d in parts[1:] if d for day in shifted(d)]
+
+        for name in copies(parts[0]):
+            days_off.append(','.join([name] + off))
+
+    def requests(lines):
+        out = []
+
+        for line in lines:
+            name, day, shift, weight = line.split(',')
+
+            for copy in copies(name):
+                for d in shifted(day):
+                    out.append('{0},{1},{2},{3}'.format(copy, d, shift, weight))
+
+        return out
+
+    cover = []
+
+    for line in sections['SECTION_COVER']:
+        day, shift, req, under, over = line.split(',')
+
+        for d in shifted(day):
+            cover.append('{0},{1},{2},{3},{4}'.format(d, shift, int(req) * employees, under, over))
+
+    InstanceGenerator.write_sections(out_path, [
+        ('SECTION_HORIZON', [str(n_days * days)]),
+        ('SECTION_SHIFTS', sections['SECTION_SHIFTS']),
+        ('SECTION_STAFF', staff),
+        ('SECTION_DAYS_OFF', days_off),
+        ('SECTION_SHIFT_ON_REQUESTS', requests(sections['SECTION_SHIFT_ON_REQUESTS'])),
+        ('SECTION_SHIFT_OFF_REQUESTS', requests(sections['SECTION_SHIFT_OFF_REQUESTS'])),
+        ('SECTION_COVER', cover),
+    ])
+
+def best_time(fn, n = 1, repeat = REPEAT, setup = None):
+    """
+    The best over repeat runs of the seconds per call of n calls to fn, each
+    run starting from the same random state. Given setup, each run first
+    calls it, untimed, and hands what it returns to fn.
+    """
+    timings = []
+
+    for k in xrange(repeat):
+        random.seed(SEED)
+        np.random.seed(SEED)
+        args = (setup(),) if setup is not None else ()
+        start = time()
+
+        for i in xrange(n):
+            fn(*args)
+
+        timings.append((time() - start) / n)
+
+    return min(timings)
+
+def bench_instance(path, repeat = REPEAT):
+    """
+    Seconds per operation on the hot paths, for the instance at path.
+    """
+    results = {}
+    parser = Parser()
+    parser.use_cache = False
+    results['parse'] = best_time(lambda: parser.parse(path), repeat=repeat)
+
+    problem = parser.parse(path)
+    evaluator = ScheduleEvaluator(problem, cache_size=0)
+    pop_gen = MixedPopulationGenerator(problem)
+
+    random.seed(SEED)
+    pops = pop_gen.generate_population(POP_SIZE)
+    results['generate_population'] = best_time(lambda: pop_gen.generate_population(POP_SIZE),
+                                               repeat=repeat) / POP_SIZE
+
+    # From scratch, on instances without cached results
+    fresh = lambda: [pop._derive(pop._matrix) for pop in pops]
+    results['evaluate'] = best_time(lambda insts: [evaluator.evaluate(inst) for inst in insts],
+                                    repeat=repeat, setup=fresh) / POP_SIZE
+    results['evaluate_population'] = best_time(evaluator.evaluate_population, repeat=repeat,
+                                               setup=fresh) / POP_SIZE
+
+    evaluator.evaluate_population(pops)
+    pairs = [(random.choice(pops), random.choice(pops)) for i in xrange(N_OPS)]
+    results['cross'] = best_time(lambda: [a.cross(b) for a, b in pairs], repeat=repeat) / N_OPS
+    results['mutate'] = best_time(lambda: [a.mutate() for a, b in pairs], repeat=repeat) / N_OPS
+
+    # Incremental, on children of evaluated parents
+    children = lambda: [a.cross(b).mutate(in_place=True) for a, b in pairs]
+    results['evaluate_child'] = best_time(lambda insts: [evaluator.evaluate(inst) for inst in insts],
+                                          repeat=repeat, setup=children) / N_OPS
+
+    def run_ga():
+        ga = GeneticAlgorithm(MixedPopulationGenerator(problem), ScheduleEvaluator(problem))
+        ga.run(POP_SIZE, 0, GA_ITERATIONS)
+
+    results['ga_per_evaluation'] = best_time(run_ga, repeat=repeat) / (POP_SIZE * GA_ITERATIONS)
+
+    return results
+
+def run(instance, scales = SCALES, synthetic = SYNTHETIC, repeat = REPEAT):
+    """
+    Benchmarks the instance, copies of it scaled up and generated instances,
+    returning the results by instance name (the path given for the
+    instance itself) along with what they were measured on.
+    """
+    results = {instance : bench_instance(instance, repeat)}
+    tmp_dir = tempfile.mkdtemp()
+
+    try:
+        for employees, days in scales:
+            name = 'scaled-{0}x{1}'.format(employees, days)
+            path = os.path.join(tmp_dir, name + '.txt')
+            scale_instance(instance, path, employees, days)
+            results[name] = bench_instance(path, repeat)
+
+        for employees, days, shifts in synthetic:
+            name = 'synthetic-{0}x{1}x{2}'.format(employees, days, shifts)
+            path = os.path.join(tmp_dir, name + '.txt')
+            sections, schedule = InstanceGenerator.generate(employees, days, shifts, seed=SEED)
+            InstanceGenerator.write_sections(path, sections)
+            results[name] = bench_instance(path, repeat)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    return {
+        'meta' : {
+            'python' : platform.python_version(),
+            'numpy' : np.__version__,
+            'machine' : platform.machine(),
+            'processor' : platform.processor(),
+            'seed' : SEED,
+            'repeat' : repeat,
+        },
+        'results' : results,
+    }
+
+def compare(results, baseline, tolerance = TOLERANCE):
+    """
+    Ratios of the timings to those of the baseline, and the names of those
+    slower than it by more than the tolerance.
+    """
+    ratios = {}
+    regressions = []
+
+    for instance, timings in sorted(results['results'].iteritems()):
+        for name, seconds in sorted(timings.iteritems()):
+            base = baseline['results'].get(instance, {}).get(name)
+
+            if not base or base <= 0:
+                continue
+
+            key = '{0}/{1}'.format(instance, name)
+            ratios[key] = seconds / base
+
+            if ratios[key] > 1 + tolerance:
+                regressions.append(key)
+
+    return ratios, regressions
+
+def main(argv):
+    arg_parser = argparse.ArgumentParser(description='Benchmarks the solver hot paths.')
+    arg_parser.add_argument('--instance', default='instance.txt')
+    arg_parser.add_argument('--output', default='benchmark.json', help='where to write the results')
+    arg_parser.add_argument('--baseline', help='results to compare against, failing on regressions')
+    arg_parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    arg_parser.add_argument('--repeat', type=int, default=REPEAT)
+    arg_parser.add_argument('--no-scaled', action='store_true', help='only benchmark the instance itself')
+    arg_parser.add_argument('--synthetic', action='append', metavar='EMPLOYEES,DAYS,SHIFTS',
+                            help='size of a generated instance to benchmark instead of the default ones')
+    args = arg_parser.parse_args(argv)
+
+    synthetic = [tuple(int(x) for x in size.split(',')) for size in args.synthetic] if args.synthetic else SYNTHETIC
+    results = run(args.instance, [] if args.no_scaled else SCALES, [] if args.no_scaled else synthetic, args.repeat)
+
+    with open(args.output, 'w') as fp:
+        json.dump(results, fp, indent=2, sort_keys=True)
+
+    for instance, timings in sorted(results['results'].iteritems()):
+        for name, seconds in sorted(timings.iteritems()):
+            print '{0:<16} {1:<22} {2:10.3f} ms'.format(instance, name, seconds * 1000)
+
+    if args.baseline is None:
+        return 0
+
+    with open(args.baseline, 'r') as fp:
+        baseline = json.load(fp)
+
+    ratios, regressions = compare(results, baseline, args.tolerance)
+
+    for key, ratio in sorted(ratios.iteritems()):
+        print '{0:<40} {1:6.2f}x{2}'.format(key, ratio, '  REGRESSION' if key in regressions else '')
+
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
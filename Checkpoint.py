@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+import os
+import zlib
+import cPickle as pickle
+import numpy as np
+
+VERSION = 1
+
+def atomic_write(path, data):
+    """
+    Writes the data to a temporary file next to path, then renames it over
+    path, so readers see either the old file or the whole new one.
+    """
+    tmp_path = '{0}.tmp.{1}'.format(path, os.getpid())
+
+    with open(tmp_path, 'wb') as fp:
+        fp.write(data)
+        fp.flush()
+        os.fsync(fp.fileno())
+
+    os.rename(tmp_path, path)
+
+def pack_population(arrays):
+    """
+    Stacks same shaped arrays into a compressed (dtype, shape, bytes) triple.
+    """
+    stack = np.ascontiguousarray(np.array(arrays))
+    return stack.dtype.str, stack.shape, zlib.compress(stack.tobytes(), 1)
+
+def unpack_population(packed):
+    dtype, shape, data = packed
+    return list(np.frombuffer(zlib.decompress(data), dtype=dtype).reshape(shape).copy())
+
+def save(path, state, population):
+    """
+    Atomically writes a checkpoint, the state being a dictionary of anything
+    picklable and the population a list of arrays.
+    """
+    state = dict(state, version=VERSION, population=pack_population(population))
+    atomic_write(path, pickle.dumps(state, pickle.HIGHEST_PROTOCOL))
+
+def load(path):
+    """
+    Reads a checkpoint back, returning its state and population.
+    """
+    with open(path, 'rb') as fp:
+        state = pickle.load(fp)
+
+    if state.pop('version', None) != VERSION:
+        raise ValueError('Unsupported checkpoint {0}'.format(path))
+
+    return state, unpack_population(state.pop('population'))
+
+def remove(path):
+    """
+    Deletes the checkpoint at path, if there is one.
+    """
+    if os.path.exists(path):
+        os.remove(path)
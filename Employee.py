@@ -11,8 +11,9 @@ class Employee(object):
         self.min_consecutive_days_off = 0
         self.max_weekends = 0
         self.days_off = []
-        self._shift_on_requests = []
-        self._shift_off_requests = []
+        self._shift_on_requests = {} # (day, shift) : weight
+        self._shift_off_requests = {}
+        self._shift_on_totals = {} # day : weight of all its on requests
 
     def set_max_shifts(self, shifts):
         self._max_shifts = shifts
@@ -21,35 +22,33 @@ class Employee(object):
         return self._max_shifts.get(name, 0)
 
     def add_shift_on_request(self, req):
-        day = req[0]
-
-        if day in self._shift_on_requests:
-            self._shift_on_requests[day].append(tuple(req[1:]))
-        else:
-            self._shift_on_requests = [ tuple(req[:1]) ]
+        """
+        Adds a (day, shift, weight) request to work the shift on the day.
+        """
+        day, shift, weight = req
+        self._shift_on_requests[(day, shift)] = self._shift_on_requests.get((day, shift), 0) + weight
+        self._shift_on_totals[day] = self._shift_on_totals.get(day, 0) + weight
 
     def add_shift_off_request(self, req):
-        day = req[0]
+        """
+        Adds a (day, shift, weight) request not to work the shift on the day.
+        """
+        day, shift, weight = req
+        self._shift_off_requests[(day, shift)] = self._shift_off_requests.get((day, shift), 0) + weight
+
+    def get_shift_on_requests(self):
+        return [(day, shift, weight) for (day, shift), weight in self._shift_on_requests.iteritems()]
 
-        if day in self._shift_off_requests:
-            self._shift_off_requests[day].append(tuple(req[1:]))
-        else:
-            self._shift_off_requests = [ tuple(req[:1]) ]
+    def get_shift_off_requests(self):
+        return [(day, shift, weight) for (day, shift), weight in self._shift_off_requests.iteritems()]
 
     def get_shift_penalty(self, day, shift):
         """
-        Gets penalty (if any) for shift that is on and should be off, or vice
-        versa.
+        Gets penalty (if any) for working the shift on the day ('' being a day
+        off): the weights of requests to have it off, and of requests to work
+        any other shift.
         """
-        if shift: # Possibly penalize shift on when should be off
-            if day in self._shift_off_requests:
-                for s, w in self._shift_off_requests[day]:
-                    if s == shift:
-                        return w
-        else: # Possibly penalize shift off when should be on
-            if day in self._shift_on_requests:
-                for s, w in self._shift_on_requests[day]:
-                    if s == shift:
-                        return w
-
-        return 0 # All good!
+        penalty = self._shift_off_requests.get((day, shift), 0)
+        penalty += self._shift_on_totals.get(day, 0) - self._shift_on_requests.get((day, shift), 0)
+
+        return penalty
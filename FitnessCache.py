@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+
+class FitnessCache(object):
+    """
+    A bounded least recently used cache of evaluation results, counting its
+    hits and misses.
+    """
+    def __init__(self, max_size = 10000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """
+        The cached value, or None on a miss.
+        """
+        value = self._entries.pop(key, None)
+
+        if value is None:
+            self.misses += 1
+            return None
+
+        self._entries[key] = value # Most recently used goes last
+        self.hits += 1
+
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
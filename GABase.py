@@ -1,19 +1,56 @@
 # -*- coding: utf-8 -*-
 
 from abc import ABCMeta, abstractmethod, abstractproperty
-from random import randint, random
+from random import randint, random, getstate, setstate
+from time import time
+from Selection import RouletteSelection
+from Metrics import diversity
+import Checkpoint
+
+BREEDING_STAGES = ['selection', 'cross', 'mutate', 'repair'] # Timed over every generation
 
 class Instance(object):
     __metaclass__ = ABCMeta
 
     @abstractmethod
-    def mutate(self):
+    def mutate(self, in_place = False):
+        """
+        A mutated copy of the instance, or the instance itself mutated if
+        in_place.
+        """
         pass
 
     @abstractmethod
     def cross(self, other):
         pass
 
+    @abstractmethod
+    def copy(self):
+        pass
+
+    @abstractmethod
+    def random_move(self):
+        """
+        A small random change to the instance, for make_move, or None if it
+        would change nothing.
+        """
+        pass
+
+    @abstractmethod
+    def make_move(self, move):
+        """
+        Makes a move from random_move in place.
+        """
+        pass
+
+    @abstractmethod
+    def pack(self):
+        """
+        A compact array of the instance's state, for checkpoints. Unpacked by
+        the population generator.
+        """
+        pass
+
 class Evaluator(object):
     __metaclass__ = ABCMeta
 
@@ -21,6 +58,61 @@ class Evaluator(object):
     def evaluate(self, instance):
         pass
 
+    def evaluate_population(self, instances):
+        """
+        Scores a list of instances. Override when it can be done in bulk.
+        """
+        return [self.evaluate(instance) for instance in instances]
+
+    def violations(self, instance):
+        """
+        Counts of the hard constraints the instance breaks, by type, if the
+        evaluator can tell them apart.
+        """
+        return {}
+
+    def evaluate_move(self, instance, move):
+        """
+        How much making a move from instance.random_move would change the
+        score of the instance, along with what to hand apply_move to make it,
+        leaving the instance as it is. Evaluates a moved copy in full unless
+        overridden to score just what the move changes.
+        """
+        moved = instance.copy()
+        moved.make_move(move)
+
+        return self.evaluate(moved) - self.evaluate(instance), moved
+
+    def apply_move(self, instance, move):
+        """
+        Makes a move from evaluate_move. Returns the instance as moved, which
+        need not be the one given.
+        """
+        return move
+
+class Improver(object):
+    """
+    Improves an instance, e.g. with a local search. Returns the improved
+    instance, its score and how many evaluations (or scored moves) it
+    took, leaving the given instance be.
+    """
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def improve(self, instance, score):
+        pass
+
+class Repairer(object):
+    """
+    Fixes an instance in place, e.g. so that it no longer breaks hard
+    constraints.
+    """
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def repair(self, instance):
+        pass
+
 class PopulationGenerator(object):
     __metaclass__ = ABCMeta
 
@@ -28,57 +120,275 @@ class PopulationGenerator(object):
     def generate_population(self, size):
         pass
 
+    @abstractmethod
+    def unpack_population(self, packed):
+        """
+        Rebuilds instances from what their pack methods returned.
+        """
+        pass
+
+    def parts(self, size):
+        """
+        The (generator, size) pairs a population of size is made of, in
+        order, for generators mixing those of others.
+        """
+        return [(self, size)]
+
 class GeneticAlgorithm(object):
-    def __init__(self, pop_gen, evaluator):
+    def __init__(self, pop_gen, evaluator, selection = None):
         self._pop_gen = pop_gen
         self._eval = evaluator
+        self._selection = selection or RouletteSelection()
         self.print_every = None
+        self.stopping = None # StoppingCriteria, checked every generation
+        self.on_improvement = None # Called with every new best instance and its score
+        self.checkpoint_path = None # Where to keep a checkpoint to resume from, if anywhere, until the run finishes
+        self.checkpoint_every = 10 # Seconds between checkpoints
+        self.improver = None # Improver applied to the elites every generation
+        self.repairer = None # Repairer applied to the children
+        self.repair_rate = 1.0 # Fraction of the children repaired
+        self.metrics = None # MetricsSink recording every generation
+        self.control = None # OperatorControl adapting mutation, if the instances' mutate takes its options
+        self.n_elites = 5
+        self.reset()
 
-    def _select_from_pop(self, eval_pops, score_sum):
-        curr_sum = 0
-        i = 0
-        selection = random() * score_sum
+    def reset(self):
+        """
+        Forgets the best score so far and restarts the stopping criteria.
+        """
+        self.best_score = None
+        self.stop_reason = None
+        self._last_checkpoint = time()
+        self._timings = dict.fromkeys(BREEDING_STAGES, 0.0)
+        self._offspring = [] # (child, score of its better parent, mutations applied), when adapting
 
-        for score, pop in eval_pops:
-            fitness = 1.0 / score
-            if curr_sum <= selection <= curr_sum + fitness:
-                return pop
+        if self.control is not None:
+            self.control.reset()
 
-            curr_sum += fitness
+        if self.stopping is not None:
+            self.stopping.start()
 
-            i += 1
+    def run(self, pop_size, min_score, max_iter):
+        self.reset()
+        pops = self._pop_gen.generate_population(pop_size)
+        eval_pops = self.evolve(pops, min_score, max_iter)
 
-        return eval_pops[-1][1] # Default to the last one. Should not be reached
+        return eval_pops[0][1], eval_pops[0][0]
 
+    def resume(self, path, min_score, max_iter):
+        """
+        Continues a run from the checkpoint at path, exactly as it would have
+        gone on had it not been stopped.
+        """
+        state, packed = Checkpoint.load(path)
 
+        self.reset()
+        self.best_score = state['best_score']
+        setstate(state['random'])
 
-    def run(self, pop_size, min_score, max_iter):
-        pops = self._pop_gen.generate_population(pop_size)
-        best_score = None
+        if self.stopping is not None and state['stopping'] is not None:
+            self.stopping.set_state(state['stopping'])
+
+        if self.control is not None and state.get('control') is not None:
+            self.control.set_state(state['control'])
+
+        pops = self._pop_gen.unpack_population(packed)
+        self._offspring = [(pops[k], score, applied) for k, score, applied in state.get('offspring', [])]
+        eval_pops = self.evolve(pops, min_score, max_iter, state['iteration'])
+
+        return eval_pops[0][1], eval_pops[0][0]
+
+    def _save_checkpoint(self, pops, i):
+        state = {
+            'iteration' : i,
+            'best_score' : self.best_score,
+            'random' : getstate(),
+            'stopping' : self.stopping.get_state() if self.stopping is not None else None,
+            'control' : self.control.get_state() if self.control is not None else None,
+            'offspring' : self._pack_offspring(pops),
+        }
+
+        Checkpoint.save(self.checkpoint_path, state, [pop.pack() for pop in pops])
+        self._last_checkpoint = time()
+
+    def evolve(self, pops, min_score, max_iter, start_iter = 0, eval_pops = None):
+        """
+        Evolves a population for up to max_iter generations, until its best
+        score gets down to min_score or the stopping criteria say so. Returns
+        the (score, instance) pairs of the last generation, best first.
+        Given those pairs of an already scored population as eval_pops, it
+        breeds from them straight away instead of scoring pops. Without any
+        generations left to run, it just scores pops.
+        """
+        pop_size = len(eval_pops) if eval_pops is not None else len(pops)
+        self.stop_reason = 'max iterations'
+
+        recording = self.metrics is not None and self.metrics.enabled
+
+        for i in xrange(start_iter, max_iter):
+            started = time() if recording else None
+
+            if eval_pops is not None:
+                pops = self._breed(eval_pops, pop_size)
+
+            if self.checkpoint_path is not None and time() - self._last_checkpoint >= self.checkpoint_every:
+                self._save_checkpoint(pops, i)
 
-        for i in xrange(max_iter):
             # Evaluate the current pop
-            eval_pops = sorted([(self._eval.evaluate(pop), pop) for pop in pops])
-            score_sum = sum([1.0 / v[0] for v in eval_pops])
+            evaluation_started = time() if recording else None
+            eval_pops = sorted(zip(self._eval.evaluate_population(pops), pops), key=lambda x: x[0])
+            evaluations = len(pops)
+            improvement_started = time() if recording else None
 
-            # Generate a new population (elitism!)
-            pops = [x[1] for x in eval_pops[0:5]]
+            if self.control is not None:
+                self._credit_operators(eval_pops)
 
-            if best_score is None:
-                best_score = eval_pops[0][0]
-            else:
-                best_score = min(best_score, eval_pops[0][0])
+            if self.improver is not None:
+                eval_pops, improver_evaluations = self._improve(eval_pops)
+                evaluations += improver_evaluations
+
+            best_score, best = eval_pops[0]
+            improved = self.best_score is None or best_score < self.best_score
+
+            if self.control is not None:
+                self.control.update(improved)
+
+            if recording:
+                self._timings['evaluation'] = improvement_started - evaluation_started
+                self._timings['improvement'] = time() - improvement_started
+                self._timings['generation'] = time() - started
+                self._record_metrics(i, eval_pops, evaluations)
+
+            if improved:
+                self.best_score = best_score
+
+                if self.on_improvement is not None:
+                    self.on_improvement(best, best_score)
+
+            if self.stopping is not None:
+                self.stopping.update(best_score, evaluations)
 
             if self.print_every is not None and i % self.print_every == 0:
-                print 'Iteration {0}, best score {1}'.format(i, self._eval._evaluate(pops[0]))
+                print 'Iteration {0}, best score {1}'.format(i, best_score)
 
-            if best_score is not None and best_score <= min_score:
+            if best_score <= min_score:
+                self.stop_reason = 'min score'
                 break
 
-            for i in xrange(5, pop_size):
-                parent_a = self._select_from_pop(eval_pops, score_sum)
-                parent_b = self._select_from_pop(eval_pops, score_sum)
-                child = parent_a.cross(parent_b).mutate()
-                pops.append(child)
+            reason = self.stopping.should_stop() if self.stopping is not None else None
+
+            if reason is not None:
+                self.stop_reason = reason
+                break
+
+        if eval_pops is None: # Out of generations before the first one
+            eval_pops = sorted(zip(self._eval.evaluate_population(pops), pops), key=lambda x: x[0])
+
+        if self.checkpoint_path is not None:
+            Checkpoint.remove(self.checkpoint_path) # Finished, so nothing to resume
+
+        return eval_pops
+
+    def _record_metrics(self, i, eval_pops, evaluations):
+        scores = [float(score) for score, pop in eval_pops]
+        spread, distinct = diversity([pop.pack() for score, pop in eval_pops])
+        metrics = {
+            'iteration' : i,
+            'evaluations' : evaluations,
+            'best' : scores[0],
+            'mean' : sum(scores) / len(scores),
+            'worst' : scores[-1],
+            'best_violations' : self._eval.violations(eval_pops[0][1]),
+            'diversity' : spread,
+            'distinct' : distinct,
+        }
+
+        for stage, seconds in self._timings.iteritems():
+            metrics[stage + '_time'] = seconds
+
+        if self.control is not None:
+            metrics['control'] = self.control.stats()
+
+        self.metrics.record(metrics)
+        self._timings.update(dict.fromkeys(BREEDING_STAGES, 0.0))
+
+    def _pack_offspring(self, pops):
+        """
+        The children waiting to be credited, by index into pops.
+        """
+        index = dict((id(pop), k) for k, pop in enumerate(pops))
+        return [(index[id(child)], score, applied) for child, score, applied in self._offspring]
+
+    def _credit_operators(self, eval_pops):
+        scores = dict((id(pop), score) for score, pop in eval_pops)
+
+        for child, parent_score, applied in self._offspring:
+            self.control.credit(applied, scores[id(child)] < parent_score)
+
+        self._offspring = []
+
+    def _improve(self, eval_pops):
+        """
+        Improves the elites. Returns the population, best first, and how
+        many evaluations it took.
+        """
+        improved = [self.improver.improve(pop, score) for score, pop in eval_pops[:self.n_elites]]
+        elites = [(score, pop) for pop, score, evaluations in improved]
+        evaluations = sum(evaluations for pop, score, evaluations in improved)
+
+        return sorted(elites + eval_pops[self.n_elites:], key=lambda x: x[0]), evaluations
+
+    def _breed(self, eval_pops, pop_size):
+        # Stages only get timed for a sink that records them
+        timed = self.metrics is not None and self.metrics.enabled
+        timings = self._timings
+        started = time() if timed else None
+        self._selection.prepare(eval_pops)
+
+        if timed:
+            timings['selection'] += time() - started
+
+        # Generate a new population (elitism!)
+        pops = [x[1] for x in eval_pops[0:self.n_elites]]
+
+        if self.control is not None:
+            scores = dict((id(pop), score) for score, pop in eval_pops)
+            options = self.control.mutation_options()
+
+        for i in xrange(self.n_elites, pop_size):
+            if timed:
+                t0 = time()
+
+            parent_a = self._selection.select()
+            parent_b = self._selection.select()
+
+            if timed:
+                t1 = time()
+
+            child = parent_a.cross(parent_b)
+
+            if timed:
+                t2 = time()
+
+            if self.control is not None:
+                applied = []
+                child = child.mutate(applied=applied, in_place=True, **options)
+                self._offspring.append((child, min(scores[id(parent_a)], scores[id(parent_b)]), applied))
+            else:
+                child = child.mutate(in_place=True)
+
+            if timed:
+                t3 = time()
+                timings['selection'] += t1 - t0
+                timings['cross'] += t2 - t1
+                timings['mutate'] += t3 - t2
+
+            if self.repairer is not None and random() < self.repair_rate:
+                self.repairer.repair(child)
+
+                if timed:
+                    timings['repair'] += time() - t3
+
+            pops.append(child)
 
-        return pops[0], best_score
+        return pops
@@ -1,17 +1,27 @@
 # -*- coding: utf-8 -*-
 
-from GABase import Evaluator, Instance, PopulationGenerator
+import numpy as np
+from FitnessCache import FitnessCache
+from GABase import Evaluator, Instance, PopulationGenerator, Repairer
+from Problem import OFF
 from random import random, randint, choice
-from math import floor
 from sys import exit
 
 N_MUTATIONS = 2 # Maximum number of possible mutations in generation
 P_MUTATION = 0.1
+MUTATIONS = ['unset', 'set', 'swap_in_row', 'swap_in_col'] # Kinds of mutation, by index
 
 P_NOT_WORKING = 0.15
+P_SWAP = 0.5 # Chance of a random move being a same day swap rather than a reassignment
 
 HARD_CONSTR_PENALTY = 2500 # Penalty for each break of hard constraints
 
+DELTA_MAX_ROWS = 3 # Past this many changed rows, re-evaluate the whole instance
+
+FITNESS_CACHE_SIZE = 10000 # Results of this many distinct schedules are kept
+
+REFRESH_CHUNK = 256 # Schedules evaluated together from scratch, bounding the memory it takes
+
 def is_weekday(day):
     return day % 7 < 5
 
@@ -24,122 +34,333 @@ def is_saturday(day):
 def is_sunday(day):
     return day % 7 == 6
 
-def unshared_copy(inList):
-    if isinstance(inList, list):
-        return list( map(unshared_copy, inList) )
-    return inList
+def weighted_choice(weights):
+    """
+    An index into weights, picked with chances proportional to them.
+    """
+    r = random() * sum(weights)
 
-def move(mtx, i, a, b):
-    prev = ''
-    for day in xrange(a, b):
-        mtx[i][day], prev = prev, mtx[i][day]
+    for k, weight in enumerate(weights):
+        r -= weight
 
-class ScheduleInstance(Instance):
-    def __init__(self, days = 0, employees = [], shift_names = []):
-        self._matrix = []
-        self._shift_names = shift_names
+        if r < 0:
+            return k
 
-        for employee in employees:
-            row = []
+    return len(weights) - 1
 
-            for i in xrange(days):
-                row.append(None)
+class ScheduleInstance(Instance):
+    """
+    An employees x days schedule. Cells hold int8 shift codes, where OFF is a
+    day off and shift_names[k - 1] is the shift with code k.
 
-            self._matrix.append(row)
+    The instance also carries the evaluator's cached per-row results and
+    per-day cover counts, along with the rows and days changed since, and
+    the hash of its matrix once computed.
 
-        if self._matrix:
-            self._rows = len(self._matrix)
-            self._cols = len(self._matrix[0])
+    Copies share the matrix and cached results until one of them changes,
+    so anything writing to them has to call _writable first.
+    """
+    def __init__(self, days = 0, employees = [], shift_names = []):
+        self._shift_names = shift_names
+        self._names = np.array([''] + list(shift_names), dtype=object)
+        self._matrix = np.zeros((len(employees), days), dtype=np.int8)
+        self._rows, self._cols = self._matrix.shape
+        self._shared = False
+        self._clear_cache()
 
     def __str__(self):
         lines = []
 
         for assignments in self._matrix:
-            lines.append('\t'.join(assignments))
+            lines.append('\t'.join(self._names[assignments]))
 
         return '\n'.join(lines)
 
+    def pack(self):
+        return self._matrix
+
+    def _derive(self, matrix):
+        """
+        Creates an instance with the same shift names around the given matrix.
+        """
+        inst = ScheduleInstance.__new__(ScheduleInstance)
+        inst._shift_names = self._shift_names
+        inst._names = self._names
+        inst._matrix = matrix
+        inst._rows, inst._cols = matrix.shape
+        inst._shared = False
+        inst._clear_cache()
+
+        return inst
+
+    def _fingerprint(self):
+        if self._key is None:
+            self._key = hash(self._matrix.tobytes())
+
+        return self._key
+
+    def _clear_cache(self):
+        self._key = None
+        self._row_hard = None
+        self._row_score = None
+        self._cover_counts = None
+        self._cover_scores = None
+        self._dirty_rows = set()
+        self._dirty_cols = set()
+
+    def _inherit_cache(self, parent):
+        """
+        Shares the parent's cache, for an instance with the same matrix.
+        """
+        self._key = parent._key
+        self._row_hard = parent._row_hard
+        self._row_score = parent._row_score
+        self._cover_counts = parent._cover_counts
+        self._cover_scores = parent._cover_scores
+        self._dirty_rows = set(parent._dirty_rows)
+        self._dirty_cols = set(parent._dirty_cols)
+
+    def copy(self):
+        """
+        A copy on write, sharing the matrix and cache with this instance.
+        """
+        inst = self._derive(self._matrix)
+        inst._inherit_cache(self)
+        self._shared = inst._shared = True
+
+        return inst
+
+    def random_move(self):
+        """
+        A random move as a list of (row, col, code) cells to set. Either a cell
+        gets a different shift (or a day off), or two employees swap their
+        shifts on the same day. Returns None if the move would change nothing.
+        """
+        col = randint(0, self._cols - 1)
+        i = randint(0, self._rows - 1)
+
+        if random() < P_SWAP:
+            j = randint(0, self._rows - 1)
+
+            if self._matrix[i, col] == self._matrix[j, col]:
+                return None
+
+            return [(i, col, self._matrix[j, col]), (j, col, self._matrix[i, col])]
+
+        code = randint(0, len(self._shift_names) - 1)
+
+        if code >= self._matrix[i, col]:
+            code += 1 # Skip over the current one
+
+        return [(i, col, code)]
+
+    def make_move(self, move):
+        self._assign(move)
+
+    def _writable(self):
+        """
+        Gives the instance its own matrix and cache if it shares them.
+        """
+        if not self._shared:
+            return
+
+        self._matrix = self._matrix.copy()
+
+        if self._row_hard is not None:
+            self._row_hard = self._row_hard.copy()
+            self._row_score = self._row_score.copy()
+            self._cover_counts = self._cover_counts.copy()
+            self._cover_scores = self._cover_scores.copy()
+
+        self._shared = False
+
+    def _assign(self, cells):
+        """
+        Sets (row, col, code) cells and marks what they change. Returns what
+        _undo needs to put back both the cells and the cached results.
+        """
+        self._writable()
+        old_cells = [(row, col, self._matrix[row, col]) for row, col, code in cells]
+        rows = set(row for row, col, code in cells)
+        cols = set()
+
+        # A day's cover counts only change if its codes are not just shuffled
+        for col in set(col for row, col, code in cells):
+            old_codes = sorted(c for r, d, c in old_cells if d == col)
+            new_codes = sorted(c for r, d, c in cells if d == col)
+
+            if old_codes != new_codes:
+                cols.add(col)
+
+        if self._row_hard is None: # E.g. when its score came from the fitness cache
+            undo = (old_cells, None, None, None, None)
+        else:
+            undo = (old_cells, set(self._dirty_rows), set(self._dirty_cols),
+                    [(row, self._row_hard[row], self._row_score[row]) for row in rows],
+                    [(col, self._cover_counts[col].copy(), self._cover_scores[col]) for col in cols])
+
+        for row, col, code in cells:
+            self._matrix[row, col] = code
+
+        self._touch(rows, cols)
+
+        return undo
+
+    def _undo(self, undo):
+        old_cells, dirty_rows, dirty_cols, rows, cols = undo
+        self._writable()
+
+        for row, col, code in reversed(old_cells):
+            self._matrix[row, col] = code
+
+        self._key = None
+
+        if rows is None:
+            # Any cache there is now is of the assigned cells, so they are stale
+            self._touch(rows=[row for row, col, code in old_cells],
+                        cols=[col for row, col, code in old_cells])
+            return
+
+        self._dirty_rows, self._dirty_cols = dirty_rows, dirty_cols
+
+        for row, hard, score in rows:
+            self._row_hard[row], self._row_score[row] = hard, score
+
+        for col, counts, score in cols:
+            self._cover_counts[col], self._cover_scores[col] = counts, score
+
+    def _touch(self, rows = (), cols = ()):
+        """
+        Marks rows and days whose cached results are no longer valid.
+        """
+        self._key = None
+        self._dirty_rows.update(rows)
+        self._dirty_cols.update(cols)
+
     def _swap_rows(self, i, j):
-        self._matrix[i], self._matrix[j] = self._matrix[j][:], self._matrix[i][:]
+        self._writable()
+        self._matrix[[i, j]] = self._matrix[[j, i]]
+        self._touch(rows=(i, j)) # Same day counts, but rows belong to employees
 
     def _swap_cols(self, i, j):
-        for k in xrange(self._rows):
-            self._matrix[k][i], self._matrix[k][j] = self._matrix[k][j], self._matrix[k][i]
+        self._writable()
+        self._matrix[:, [i, j]] = self._matrix[:, [j, i]]
+        self._touch(rows=xrange(self._rows), cols=(i, j))
 
     def _set_random(self, value):
         i = randint(0, self._rows - 1)
         j = randint(0, self._cols - 1)
 
-        self._matrix[i][j] = value
+        self._writable()
+        self._matrix[i, j] = value
+        self._touch(rows=(i,), cols=(j,))
 
-    def mutate(self):
-        mutant = ScheduleInstance()
-        mutant._matrix = unshared_copy(self._matrix)
-        mutant._shift_names = self._shift_names
+    def mutate(self, weights = None, n_mutations = N_MUTATIONS, p_mutation = P_MUTATION, applied = None,
+               in_place = False):
+        """
+        Makes up to n_mutations MUTATIONS, each with chance p_mutation, of kinds
+        picked uniformly or by weights. Appends the index of each kind made
+        to applied if given. Mutates a copy unless in_place, for a child
+        nothing else refers to, which then only copies what it shares.
+        """
+        mutant = self if in_place else self.copy()
 
-        mutant._rows = self._rows
-        mutant._cols = self._cols
+        for i in xrange(n_mutations):
+            if random() <= p_mutation:
+                mut_choice = randint(1, 4) if weights is None else weighted_choice(weights) + 1
 
-        for i in xrange(N_MUTATIONS):
-            if random() <= P_MUTATION:
-                mut_choice = randint(1, 4)
+                if applied is not None:
+                    applied.append(mut_choice - 1)
 
                 if mut_choice == 1: #Unset assignment
-                    self._set_random('')
+                    mutant._set_random(OFF)
                 elif mut_choice == 2: #Set assignment
-                    self._set_random(choice(self._shift_names))
+                    mutant._set_random(randint(1, len(self._shift_names)))
                 elif mut_choice == 3: #Swap two assignments in row
                     row = randint(0, self._rows - 1)
                     j = randint(0, self._cols - 1)
                     k = randint(0, self._cols - 1)
 
-                    mutant._matrix[row][j], mutant._matrix[row][k] = \
-                        mutant._matrix[row][k], mutant._matrix[row][j]
+                    mutant._writable()
+                    mutant._matrix[row, [j, k]] = mutant._matrix[row, [k, j]]
+                    mutant._touch(rows=(row,), cols=(j, k))
                 else: #Swap two assignments in col
                     col = randint(0, self._cols - 1)
 
                     j = randint(0, self._rows - 1)
                     k = randint(0, self._rows - 1)
 
-                    mutant._matrix[j][col], mutant._matrix[k][col] = \
-                        mutant._matrix[k][col], mutant._matrix[j][col]
+                    mutant._writable()
+                    mutant._matrix[[j, k], col] = mutant._matrix[[k, j], col]
+                    mutant._touch(rows=(j, k)) # Day's cover counts stay the same
         return mutant
 
 
     def cross(self, other):
         #Uniform cross on rows (inherit one of the mployee assignments)
-        baby = ScheduleInstance()
-        baby._shift_names = self._shift_names
-        baby._rows = self._rows
-        baby._cols = self._cols
-        baby._matrix = [['' for j in xrange(self._cols)] for i in xrange(self._rows)]
-
-        cross_week = floor(randint(0, self._cols - 1) // 7)
+        cross_week = randint(0, self._cols - 1) // 7
         cross_day = cross_week * 7
 
-        for i in xrange(self._rows):
-            for j in xrange(self._cols):
-                if j < cross_day:
-                    baby._matrix[i][j] = self._matrix[i][j]
-                else:
-                    baby._matrix[i][j] = other._matrix[i][j]
+        if cross_day == 0: # Nothing from self, so share other's matrix
+            return other.copy()
+
+        matrix = np.empty_like(self._matrix)
+        matrix[:, :cross_day] = self._matrix[:, :cross_day]
+        matrix[:, cross_day:] = other._matrix[:, cross_day:]
+
+        baby = self._derive(matrix)
+
+        if self._row_hard is not None and other._row_hard is not None:
+            baby._inherit_cross_cache(self, other, cross_day)
 
         return baby
 
+    def _inherit_cross_cache(self, head, tail, cross_day):
+        """
+        Builds the cache of a cross of head and tail at cross_day. Day covers
+        come from the parent the day was taken from, and rows from a parent
+        whose row came through whole.
+        """
+        same_tail = (head._matrix[:, cross_day:] == tail._matrix[:, cross_day:]).all(axis=1)
+        same_head = (head._matrix[:, :cross_day] == tail._matrix[:, :cross_day]).all(axis=1)
+
+        self._row_hard = np.where(same_tail, head._row_hard, tail._row_hard)
+        self._row_score = np.where(same_tail, head._row_score, tail._row_score)
+        self._cover_counts = np.concatenate((head._cover_counts[:cross_day], tail._cover_counts[cross_day:]))
+        self._cover_scores = np.concatenate((head._cover_scores[:cross_day], tail._cover_scores[cross_day:]))
+
+        self._touch(rows=np.flatnonzero(~(same_tail | same_head)).tolist())
+        self._touch(rows=[i for i in head._dirty_rows if same_tail[i]])
+        self._touch(rows=[i for i in tail._dirty_rows if not same_tail[i]])
+        self._touch(cols=[col for col in head._dirty_cols if col < cross_day])
+        self._touch(cols=[col for col in tail._dirty_cols if col >= cross_day])
+
 
 class ScheduleEvaluator(Evaluator):
-    def __init__(self, problem):
-        self._problem = problem
+    """
+    Scores schedules, remembering the results for the last cache_size
+    distinct ones in cache (None if cache_size is 0).
+    """
+    def __init__(self, problem, cache_size = FITNESS_CACHE_SIZE):
+        self._problem = problem.compile()
+        self.cache = FitnessCache(cache_size) if cache_size else None
         self._employee_map = {}
-        self._shift_map = {}
-        self._no_follows = {s.name : s.not_followed_by for s in self._problem.shifts}
-        self._shift_durations = {s.name : s.time for s in self._problem.shifts}
+        self._n_codes = len(problem.shift_names)
 
         for i, e in enumerate(self._problem.employees):
             self._employee_map[e.name] = i
 
-        for i, s in enumerate(self._problem.shifts):
-            self._shift_map[s.name] = i
+        # The compiled tables as plain lists, for the per-row evaluation
+        self._no_follows = problem.no_follow.tolist()
+        self._shift_durations = problem.durations.tolist()
+        self._days_off = problem.days_off.tolist()
+        self._shift_penalties = problem.shift_penalties.tolist()
+        self._max_shifts = problem.max_shifts.tolist()
+        self._saturdays = [is_saturday(day) for day in xrange(problem.days)]
+        self._sundays = [is_sunday(day) for day in xrange(problem.days)]
+        self._cover_reqs = problem.cover_reqs.tolist()
+        self._cover_under = problem.cover_under.tolist()
+        self._cover_over = problem.cover_over.tolist()
 
     def evaluate(self, inst):
         broke_hard, score = self._evaluate(inst)
@@ -149,135 +370,447 @@ class ScheduleEvaluator(Evaluator):
 
         return score
 
+    def evaluate_population(self, instances):
+        """
+        Scores all the instances, giving the same scores as evaluate. Those
+        with too much changed since their last evaluation are re-evaluated
+        together, the rest incrementally, unless already in the cache.
+        """
+        self._refresh(self._stale_instances(instances))
+
+        return [self.evaluate(inst) for inst in instances]
+
     def is_feasible(self, inst):
         broke_hard, score = self._evaluate(inst)
         return broke_hard == 0
 
+    def _is_stale(self, inst):
+        return inst._row_hard is None or len(inst._dirty_rows) > DELTA_MAX_ROWS
+
+    def _stale_instances(self, instances):
+        """
+        Those of the instances evaluate_population evaluates from scratch.
+        """
+        stale = [inst for inst in instances if self._is_stale(inst)]
+
+        if self.cache is not None:
+            # Those in the cache are looked up (and counted) by evaluate
+            stale = [inst for inst in stale if inst._fingerprint() not in self.cache]
+            self.cache.misses += len(stale)
+
+        return stale
+
+    def _refresh(self, instances):
+        """
+        Evaluates the instances from scratch and fills in their caches.
+        """
+        for start in xrange(0, len(instances), REFRESH_CHUNK):
+            chunk = instances[start:start + REFRESH_CHUNK]
+            self._attach(chunk, self._evaluate_population(np.array([inst._matrix for inst in chunk])))
+
+    def _attach(self, instances, results):
+        """
+        Fills in the caches of the instances from what _evaluate_population
+        returned for their matrices.
+        """
+        row_hard, row_score, cover_counts, cover_scores = results
+
+        for k, inst in enumerate(instances):
+            inst._row_hard = row_hard[k]
+            inst._row_score = row_score[k]
+            inst._cover_counts = cover_counts[k]
+            inst._cover_scores = cover_scores[k]
+            inst._dirty_rows = set()
+            inst._dirty_cols = set()
+
     def _evaluate(self, inst):
         """
         Computes the score of a potential solutions (the penalty), and whether
-        any hard constraints were broken.
+        any hard constraints were broken. Only the rows and days changed since
+        the last evaluation are recomputed. Schedules that would need a full
+        evaluation are looked up in the cache first.
         """
-        score = 0
-        broke_hard = 0
+        if self._is_stale(inst):
+            result = self.cache.get(inst._fingerprint()) if self.cache is not None else None
+
+            if result is not None:
+                return result
+
+            self._refresh([inst])
 
-        # Let us first iterate through the employee row related stuff
-        for i in xrange(inst._rows):
-            broke_hard_empl, score_empl = self._evaluate_for_employee(inst._matrix[i], i)
+        # Let us first re-evaluate the changed employee rows
+        for i in inst._dirty_rows:
+            inst._row_hard[i], inst._row_score[i] = self._evaluate_for_employee(inst._matrix[i], i)
 
-            broke_hard += broke_hard_empl
+        inst._dirty_rows = set()
 
-            score += score_empl
+        broke_hard = int(inst._row_hard.sum())
+        score = int(inst._row_score.sum())
 
         # Now we need to check if the shift covers were satisfied
         score += self._evaluate_section_covers(inst)
 
+        if self.cache is not None:
+            self.cache.put(inst._fingerprint(), (broke_hard, score))
+
         return broke_hard, score
 
 
-    def _evaluate_section_covers(self, inst):
-        score = 0
+    def evaluate_move(self, inst, cells):
+        """
+        How much setting the (row, col, code) cells of a random_move would
+        change the score of inst, evaluating only their rows and days, along
+        with the move to hand to apply_move to make it. Leaves inst as it is.
+        """
+        if self._is_stale(inst):
+            self._refresh([inst])
 
-        for col in xrange(inst._cols): #For each day
-            shift_covers = {}
+        if inst._dirty_rows or inst._dirty_cols:
+            self._evaluate(inst)
 
-            if not self._problem.section_covers[col]:
-                continue #Nothing to check
+        matrix = inst._matrix
+        changed_rows = {}
+        changed_cols = {}
 
-            for shift in self._problem.shifts:
-                shift_covers[shift.name] = 0
+        for row, col, code in cells:
+            old_code = int(matrix[row, col])
+            changed_rows.setdefault(row, []).append((col, code))
+            changes = changed_cols.setdefault(col, {})
+            changes[old_code] = changes.get(old_code, 0) - 1
+            changes[code] = changes.get(code, 0) + 1
 
-            for row in xrange(inst._rows):
-                val = inst._matrix[row][col]
+        delta = 0
+        rows = []
 
-                if val:
-                    shift_covers[val] += 1
+        for i, row_cells in changed_rows.iteritems():
+            codes = matrix[i].tolist()
 
-            for shift in shift_covers:
-                for name, req, w_under, w_over in self._problem.section_covers[col]:
-                    if name == shift:
-                        if shift_covers[shift] < req:
-                            score += w_under
-                        if shift_covers[shift] > req:
-                            score += w_over
+            for col, code in row_cells:
+                codes[col] = code
 
-        return score
+            hard, score = self._evaluate_row(codes, i)
+            delta += HARD_CONSTR_PENALTY * (hard - int(inst._row_hard[i])) + score - int(inst._row_score[i])
+            rows.append((i, hard, score))
+
+        cols = []
+
+        for col, changes in changed_cols.iteritems():
+            counts = inst._cover_counts[col]
+            reqs, under, over = self._cover_reqs[col], self._cover_under[col], self._cover_over[col]
+            cover_delta = 0
+
+            for code, change in changes.iteritems():
+                if not change:
+                    continue # Just shuffled within the day
+
+                old_count = int(counts[code])
+
+                for count, sign in ((old_count, -1), (old_count + change, 1)):
+                    if count < reqs[code]:
+                        cover_delta += sign * under[code]
+                    elif count > reqs[code]:
+                        cover_delta += sign * over[code]
+
+            delta += cover_delta
+            cols.append((col, changes, int(inst._cover_scores[col]) + cover_delta))
+
+        return delta, (cells, rows, cols)
+
+    def apply_move(self, inst, move):
+        """
+        Makes a move from evaluate_move in place, filling in the cached
+        results of the rows and days it changes. Returns inst.
+        """
+        cells, rows, cols = move
+        inst._assign(cells)
+
+        for i, hard, score in rows:
+            inst._row_hard[i], inst._row_score[i] = hard, score
+            inst._dirty_rows.discard(i)
+
+        for col, changes, score in cols:
+            counts = inst._cover_counts[col]
+
+            for code, change in changes.iteritems():
+                counts[code] += change
+
+            inst._cover_scores[col] = score
+            inst._dirty_cols.discard(col)
+
+        return inst
+
+    def violations(self, inst):
+        """
+        Counts of the hard constraints the instance breaks, by type.
+        """
+        counts = {}
+
+        for name, breaks, first_day in self._hard_violations(inst._matrix[None]):
+            counts[name] = int(breaks.sum())
+
+        return counts
+
+    def explain(self, inst):
+        """
+        Every constraint the instance breaks, as (type, employee, day, shift,
+        weight) tuples, costliest first. Employees, days and shifts are
+        indices into the problem, None for constraints not about one, e.g.
+        covers are about no employee. The weights add up to the score.
+        """
+        problem = self._problem
+        codes = inst._matrix.astype(np.intp)
+        n_days = codes.shape[1]
+        shifts = np.arange(self._n_codes)
+        breaks = []
+
+        for name, mask, first_day in self._hard_violations(inst._matrix[None]):
+            mask = mask[0]
+
+            if first_day is not None:
+                for employee, day in zip(*[x.tolist() for x in np.nonzero(mask)]):
+                    day += first_day
+                    breaks.append((name, employee, day, int(codes[employee, day]), HARD_CONSTR_PENALTY))
+            elif mask.ndim == 2: # Per shift type
+                for employee, shift in zip(*[x.tolist() for x in np.nonzero(mask)]):
+                    breaks.append((name, employee, None, shift + 1, HARD_CONSTR_PENALTY))
+            else:
+                for employee in np.nonzero(mask)[0].tolist():
+                    breaks.append((name, employee, None, None, HARD_CONSTR_PENALTY))
+
+        # Requests to work a shift that was not worked, and to be off one that was
+        on = problem.shift_on_requests * (codes[:, :, None] != shifts)
+        off = problem.shift_off_requests * (codes[:, :, None] == shifts)
+
+        for name, weights in (('shift_on_request', on), ('shift_off_request', off)):
+            cells = np.nonzero(weights)
+            breaks.extend((name,) + cell for cell in zip(*[x.tolist() for x in cells + (weights[cells],)]))
+
+        # Section covers
+        counts = np.bincount((np.arange(n_days) * self._n_codes + codes).ravel(), minlength=n_days * self._n_codes)
+        counts = counts.reshape(n_days, self._n_codes)
+
+        for name, mask, weights in (('cover_under', counts < problem.cover_reqs, problem.cover_under),
+                                    ('cover_over', counts > problem.cover_reqs, problem.cover_over)):
+            cells = np.nonzero(mask * weights)
+            breaks.extend((name, None, day, shift, weight) for day, shift, weight in
+                          zip(*[x.tolist() for x in cells + (weights[cells],)]))
+
+        breaks.sort(key=lambda x: -x[4])
+
+        return breaks
+
+    def _hard_violations(self, mtx):
+        """
+        The hard constraints broken by a (population, employees, days) stack
+        of schedule matrices, as (type, breaks, first day) triples. Breaks of
+        per day constraints are (population, employees, days) masks, the
+        first of them for first_day; those of the others (population,
+        employees) masks, or counts per shift for max_shifts, with first_day
+        None.
+        """
+        problem = self._problem
+        n_pop, n_empl, n_days = mtx.shape
+        works = mtx != OFF
+        days = np.arange(n_days, dtype=np.int16) # Keeps the day arrays below small
+        violations = []
+
+        # Shifts following shifts they cannot follow
+        violations.append(('no_follow', problem.no_follow[mtx[:, :, :-1], mtx[:, :, 1:]], 1))
+
+        # Last day worked and last day off, up to and including each day
+        last_work = np.maximum.accumulate(np.where(works, days, -1), axis=2)
+        last_off = np.maximum.accumulate(np.where(works, -1, days), axis=2)
+        work_streak = days - last_off # Zero on days off
+
+        # Every shift over the maximum streak is a break
+        violations.append(('max_consecutive_shifts', work_streak > problem.max_consecutive_shifts[:, None], 0))
+
+        # A day off after too short a streak
+        streak = work_streak[:, :, :-1]
+        too_short = ~works[:, :, 1:] & (streak > 0) & (streak < problem.min_consecutive_shifts[:, None])
+        violations.append(('min_consecutive_shifts', too_short, 1))
+
+        # A shift after too short a vacation, not counting the ones at the
+        # start of the horizon or a shift on the last day
+        vacation = days[:-1] - last_work[:, :, :-1]
+        too_short = works[:, :, 1:] & (last_work[:, :, :-1] >= 0) & (vacation > 0) & \
+            (vacation < problem.min_consecutive_days_off[:, None])
+        violations.append(('min_consecutive_days_off', too_short[:, :, :-1], 1))
+
+        # Working on days off
+        violations.append(('days_off', works & problem.days_off, 0))
+
+        # Shift type counts and total minutes
+        counts = self._code_counts(mtx, axis=2)
+
+        violations.append(('max_shifts', counts[:, :, 1:] > problem.max_shifts[:, 1:], None))
+
+        time_worked = counts.dot(problem.durations)
+        violations.append(('total_minutes', (time_worked < problem.min_total_minutes) |
+                                            (time_worked > problem.max_total_minutes), None))
+
+        # Work weekends. A Sunday only counts if the last shift before it did
+        # not count, which chains across weeks, so this one goes week by week
+        work_weekends = np.zeros((n_pop, n_empl), dtype=np.int64)
+        already_worked_this_weekend = np.zeros((n_pop, n_empl), dtype=bool)
+
+        for week in xrange(0, n_days, 7):
+            week_days = works[:, :, week:week + 7]
+            already_worked_this_weekend &= ~week_days[:, :, :5].any(axis=2)
+
+            if week_days.shape[2] > 5:
+                saturday = week_days[:, :, 5]
+                work_weekends += saturday
+                already_worked_this_weekend |= saturday
+
+            if week_days.shape[2] > 6:
+                sunday = week_days[:, :, 6]
+                new_weekend = sunday & ~already_worked_this_weekend
+                work_weekends += new_weekend
+                already_worked_this_weekend = np.where(sunday, new_weekend, already_worked_this_weekend)
+
+        violations.append(('max_weekends', work_weekends > problem.max_weekends, None))
+
+        return violations
+
+    def _evaluate_population(self, mtx):
+        """
+        Vectorized _evaluate over a (population, employees, days) stack of
+        schedule matrices. Returns the broken hard constraints and scores per
+        employee, and the shift counts and scores per day.
+        """
+        problem = self._problem
+        n_pop, n_empl, n_days = mtx.shape
+        days = np.arange(n_days)
+        broke_hard = np.zeros((n_pop, n_empl), dtype=np.int64)
+
+        for name, breaks, first_day in self._hard_violations(mtx):
+            broke_hard += breaks.sum(axis=2) if breaks.ndim == 3 else breaks
+
+        # Soft constraint: requests for days on/off
+        employees = np.arange(n_empl).reshape(n_empl, 1)
+        score = problem.shift_penalties[employees, days, mtx].sum(axis=2)
+
+        # Section covers
+        cover_counts = self._code_counts(mtx, axis=1)
+
+        cover_scores = ((cover_counts < problem.cover_reqs) * problem.cover_under).sum(axis=2)
+        cover_scores += ((cover_counts > problem.cover_reqs) * problem.cover_over).sum(axis=2)
+
+        return broke_hard, score, cover_counts, cover_scores
+
+    def _code_counts(self, mtx, axis):
+        """
+        How many times each shift code appears in a stack of schedule
+        matrices along the axis, the codes being the last axis of the result.
+        """
+        counts = np.empty(mtx.shape[:axis] + mtx.shape[axis + 1:] + (self._n_codes,), dtype=np.int64)
+
+        for code in xrange(self._n_codes):
+            counts[..., code] = (mtx == code).sum(axis=axis)
+
+        return counts
+
+    def _evaluate_section_covers(self, inst):
+        for col in inst._dirty_cols: #For each changed day
+            shift_covers = np.bincount(inst._matrix[:, col], minlength=self._n_codes)
+            inst._cover_counts[col] = shift_covers
+            inst._cover_scores[col] = self._evaluate_section_cover(col, shift_covers)
+
+        inst._dirty_cols = set()
+
+        return int(inst._cover_scores.sum())
+
+    def _evaluate_section_cover(self, col, shift_covers):
+        reqs = self._problem.cover_reqs[col]
+        score = np.dot(shift_covers < reqs, self._problem.cover_under[col])
+        score += np.dot(shift_covers > reqs, self._problem.cover_over[col])
+
+        return int(score)
 
     def _evaluate_for_employee(self, row, i):
-        prev_shift = ''
-        max_shifts = {s : 0 for s in self._shift_map}
+        return self._evaluate_row(row.tolist(), i)
+
+    def _evaluate_row(self, codes, i):
+        """
+        Hard constraints broken by employee i's row, a list of shift codes,
+        and its score for their requests.
+        """
+        prev_shift = OFF
+        max_shifts = [0] * self._n_codes
+        days_off = self._days_off[i]
+        shift_penalties = self._shift_penalties[i]
+        no_follows = self._no_follows
+        durations = self._shift_durations
+        saturdays = self._saturdays
+        sundays = self._sundays
+        last_day = self._problem.days - 1
         time_worked = 0
         work_streak = 0
         vacation_streak = 0
         work_weekends = 0
         employee = self._problem.employees[i]
+        min_days_off = employee.min_consecutive_days_off
+        min_streak = employee.min_consecutive_shifts
+        max_streak = employee.max_consecutive_shifts
 
         score = 0
         already_worked_this_weekend = False
         broke_hard = 0
 
-        for day in xrange(self._problem.days):
-            shift_name = row[day]
+        for day, shift in enumerate(codes):
+            # Soft constraint: requests for days on/off
+            score += shift_penalties[day][shift]
 
-            if shift_name and prev_shift and shift_name in self._no_follows[prev_shift]:
-                broke_hard += 1
-                #print '{}: Shift {} cannot follow shift {}'.format(day, shift_name, prev_shift)
+            if shift != OFF: # Is not a vacation
+                if prev_shift and no_follows[prev_shift][shift]:
+                    broke_hard += 1
 
-            if shift_name != '': # Is not a vacation
-                max_shifts[shift_name] += 1
-                time_worked += self._shift_durations[shift_name]
+                max_shifts[shift] += 1
+                time_worked += durations[shift]
 
                 # Infinite days off beforehand and afterwards, we can not check those
-                if not (vacation_streak == day or day == self._problem.days - 1):
-                    if vacation_streak < day and 0 < vacation_streak < employee.min_consecutive_days_off:
-                        broke_hard += 1
-                        #print '{}: Broke minimum consecutive days off {}/{} on day {} of {}'.format(day, vacation_streak, employee.min_consecutive_days_off, day, self._problem.days)
+                if 0 < vacation_streak < min_days_off and vacation_streak < day and day != last_day:
+                    broke_hard += 1
 
                 vacation_streak = 0
 
                 work_streak += 1
 
-                if work_streak > employee.max_consecutive_shifts:
+                if work_streak > max_streak:
                     broke_hard += 1
-                    #print '{}: Broke maximum consecutive shifts {}/{}'.format(day, work_streak, employee.max_consecutive_shifts)
 
-                if is_saturday(day) or (not already_worked_this_weekend and is_sunday(day)):
+                if saturdays[day] or (not already_worked_this_weekend and sundays[day]):
                     work_weekends += 1
                     already_worked_this_weekend = True
                 else:
                     already_worked_this_weekend = False
 
-                if day in employee.days_off:
+                if days_off[day]:
                     broke_hard += 1
-                    #print '{}: Broke employee day off'.format(day)
 
             else: # Is a vacation
-                if 0 < work_streak < employee.min_consecutive_shifts:
+                if 0 < work_streak < min_streak:
                     broke_hard += 1
-                    #print '{}: Worked too few days before vacation {}/{}'.format(day, work_streak, employee.min_consecutive_shifts)
 
                 work_streak = 0
                 vacation_streak += 1
 
-            # Soft constraint: requests for days on/off
-            score += employee.get_shift_penalty(day, shift_name)
-
-            prev_shift = shift_name
+            prev_shift = shift
 
         # Check max shifts
-        for shift in self._shift_map:
-            if max_shifts.get(shift, 0) > employee.get_max_shift(shift):
-                #print 'Worked too many shifts of type {}: {} when max is {}'.format(shift, max_shifts.get(shift, 0), employee.get_max_shift(shift))
+        max_allowed = self._max_shifts[i]
+
+        for shift in xrange(1, self._n_codes):
+            if max_shifts[shift] > max_allowed[shift]:
                 broke_hard += 1
 
         # Check min and max work hours
         if time_worked < employee.min_total_minutes or time_worked > employee.max_total_minutes:
-            #print 'Worked total minutes {} when expecting [{}, {}]'.format(time_worked, employee.min_total_minutes, employee.max_total_minutes)
             broke_hard += 1
 
         # Check max work weekends
         if work_weekends > employee.max_weekends:
-            #print 'Worked too many weekends {}/{}'.format(work_weekends, employee.max_weekends)
             broke_hard += 1
 
         return broke_hard, score
@@ -288,16 +821,22 @@ class MixedPopulationGenerator(PopulationGenerator):
         self.gen_b = GreedySchedulePopulationGenerator(problem, True)
         self.percentage = percentage
 
-    def generate_population(self, size):
-        pops = []
+    def unpack_population(self, packed):
+        return self.gen_a.unpack_population(packed)
 
+    def parts(self, size):
         size_a_part = int(self.percentage * size)
         size_b_part = size - size_a_part
 
-        pops_a = self.gen_a.generate_population(size_a_part)
-        pops_b = self.gen_b.generate_population(size_b_part)
+        return [(self.gen_a, size_a_part), (self.gen_b, size_b_part)]
 
-        return pops_a + pops_b
+    def generate_population(self, size):
+        pops = []
+
+        for generator, part_size in self.parts(size):
+            pops += generator.generate_population(part_size)
+
+        return pops
 
 class GreedySchedulePopulationGenerator(PopulationGenerator):
     """
@@ -305,32 +844,41 @@ class GreedySchedulePopulationGenerator(PopulationGenerator):
     """
     def __init__(self, problem, randomize = False):
         self._randomize = randomize
-        self._problem = problem
-        self._shift_types = []
-        self._no_follows = {}
+        self._problem = problem.compile()
+        self._shift_types = [shift.name for shift in problem.shifts]
+        self._codes = problem.shift_codes
         self._n_employees = len(problem.employees)
-        self._shift_durations = {s.name : s.time for s in self._problem.shifts}
 
-        for shift in self._problem.shifts:
-            self._shift_types.append(shift.name)
-            self._no_follows[shift.name] = shift.not_followed_by
+        # The compiled tables as plain lists, for the per-day checks
+        self._no_follows = problem.no_follow.tolist()
+        self._shift_durations = problem.durations.tolist()
+        self._days_off = problem.days_off.tolist()
+        self._max_shifts = problem.max_shifts.tolist()
+
+        # Shortest shifts are tried first
+        possible_shifts = [(self._codes[shift], self._shift_durations[self._codes[shift]])
+                           for shift in self._shift_types]
+        self._possible_shifts = sorted(possible_shifts, key=lambda x: x[1])
 
-    def _generate_employee_assignments(self, i, inst, reverse=False):
+    def _fill_row(self, i, reverse = False, keep = None, skip_weekends = True):
+        """
+        Greedily assigns employee i a shift or a day off for every day (going
+        backwards if reverse), never breaking the constraints it keeps track
+        of. Given keep, a row to repair, its assignments are kept wherever
+        they fit. Returns the row and the minutes it works.
+        """
         work_weekends = 0
         work_streak = 0
         vacation_streak = 10000 # Large enough to represent infinity
         time_worked = 0
         already_worked_this_weekend = False
-        assigned_shifts = {shift : 0 for shift in self._shift_types}
+        assigned_shifts = [0] * len(self._shift_durations)
         employee = self._problem.employees[i]
-        prev_shift = ''
-        possible_shifts = []
-
-        for shift in self._shift_types:
-            duration = self._shift_durations[shift]
-            possible_shifts.append((shift, duration))
-
-        possible_shifts = sorted(possible_shifts, key=lambda x: x[1])#, reverse=True)
+        max_shifts = self._max_shifts[i]
+        days_off = self._days_off[i]
+        prev_shift = OFF
+        possible_shifts = self._possible_shifts
+        row = [OFF] * self._problem.days
 
         generator = xrange(self._problem.days)
 
@@ -345,11 +893,13 @@ class GreedySchedulePopulationGenerator(PopulationGenerator):
             valid_shifts = []
 
             for shift, duration in possible_shifts:
-                if prev_shift and shift in self._no_follows[prev_shift]:
+                if prev_shift and not reverse and self._no_follows[prev_shift][shift]:
+                    continue
+                if prev_shift and reverse and self._no_follows[shift][prev_shift]:
                     continue
                 if time_worked + duration > employee.max_total_minutes:
                     continue
-                if assigned_shifts[shift] + 1 > employee.get_max_shift(shift):
+                if assigned_shifts[shift] + 1 > max_shifts[shift]:
                     continue
 
                 valid_shifts.append((shift, duration))
@@ -362,18 +912,25 @@ class GreedySchedulePopulationGenerator(PopulationGenerator):
 
             # Check for situations when we CANNOT assign a user a task
             needs_vacation = work_streak == employee.max_consecutive_shifts
-            is_day_off = day in employee.days_off
+            is_day_off = days_off[day]
             done_working = time_worked == employee.max_total_minutes
             not_done_vacationing = 0 < vacation_streak < employee.min_consecutive_days_off
             too_many_work_weekends = work_weekends >= employee.max_weekends and would_be_new_work_weekend
 
-            # DON'T work a weekend unless you have to for fulfilling the min_days criterion
-            can_skip_weekend =  (is_sunday(day) and not prev_shift and would_be_new_work_weekend) \
-                             or (is_saturday(day) and employee.min_consecutive_shifts <= work_streak)
+            cannot_work = needs_vacation or is_day_off or done_working or not_done_vacationing or too_many_work_weekends or not valid_shifts
 
+            if keep is not None:
+                # Keep days off, unless that would leave too short a streak
+                rests = cannot_work or (keep[day] == OFF and not 0 < work_streak < employee.min_consecutive_shifts)
+            else:
+                # DON'T work a weekend unless you have to for fulfilling the min_days criterion
+                can_skip_weekend = skip_weekends and (
+                                   (is_sunday(day) and not prev_shift and would_be_new_work_weekend)
+                                or (is_saturday(day) and employee.min_consecutive_shifts <= work_streak))
 
+                rests = cannot_work or can_skip_weekend
 
-            if needs_vacation or is_day_off or done_working or not_done_vacationing or too_many_work_weekends or can_skip_weekend or not valid_shifts:
+            if rests:
                 # If this would break the minimum work days constraint,
                 # go back and remove the previous few work days
                 # to make it all work
@@ -383,8 +940,8 @@ class GreedySchedulePopulationGenerator(PopulationGenerator):
                     for offset in xrange(1, work_streak + 1):
                         old_day = day + offset if reverse else day - offset
 
-                        old_job = inst._matrix[i][old_day]
-                        inst._matrix[i][old_day] = ''
+                        old_job = row[old_day]
+                        row[old_day] = OFF
                         assigned_shifts[old_job] -= 1
                         time_worked -= self._shift_durations[old_job]
 
@@ -400,15 +957,22 @@ class GreedySchedulePopulationGenerator(PopulationGenerator):
 
                 work_streak = 0
                 vacation_streak += 1
-                prev_shift = ''
+                prev_shift = OFF
 
-                inst._matrix[i][day] = ''
+                row[day] = OFF
 
             else: # You're working, man
-                job, duration = choice(valid_shifts) if self._randomize else valid_shifts[0]
+                kept = [(shift, duration) for shift, duration in valid_shifts
+                        if keep is not None and shift == keep[day]]
+
+                if kept:
+                    job, duration = kept[0]
+                else:
+                    job, duration = choice(valid_shifts) if self._randomize else valid_shifts[0]
+
                 time_worked += duration
 
-                inst._matrix[i][day] = job
+                row[day] = job
                 prev_shift = job
 
                 assigned_shifts[job] += 1
@@ -418,48 +982,110 @@ class GreedySchedulePopulationGenerator(PopulationGenerator):
                 if would_be_new_work_weekend:
                     work_weekends += 1
 
-        if reverse and time_worked < employee.min_total_minutes:
-            mtx = inst._matrix
+                already_worked_this_weekend = would_be_new_work_weekend
 
-            # Now move stuff that that broke back
-            day = 1
+        return row, time_worked
 
-            while day < self._problem.days - 6:
-                can_move_back = (day == 1 and not mtx[i][0]) or (not mtx[i][day-1] and not mtx[i][day-2])
-                if is_tuesday(day) and mtx[i][day] and can_move_back:
-                    while mtx[i][day]:
-                        mtx[i][day - 1] = mtx[i][day]
-                        mtx[i][day] = ''
-                        day += 1
-                else:
-                    day += 1
+    def _generate_row(self, i):
+        """
+        Tries the greedy passes in turn until one gives employee i enough
+        minutes: forwards, backwards, and both again working weekends too.
+        Returns the row of the one that works the most otherwise.
+        """
+        employee = self._problem.employees[i]
+        best_row, best_time = None, -1
 
-            # TODO replace with actual rule
-            # Hardcoded swaps to fix the single broken example
-            move(mtx, i, 168, 182)
-            move(mtx, i, 169, 175)
-            mtx[i][167] = 'a1'
-            mtx[i][103] = 'a1'
-            mtx[i][99] = 'a1'
+        for reverse, skip_weekends in ((False, True), (True, True), (False, False), (True, False)):
+            row, time_worked = self._fill_row(i, reverse, skip_weekends=skip_weekends)
 
-        if time_worked < employee.min_total_minutes:
-            #if reverse:
-            #    print work_weekends, employee.max_weekends
-            return False
+            if time_worked >= employee.min_total_minutes:
+                return row
 
-        return True
+            if time_worked > best_time:
+                best_row, best_time = row, time_worked
+
+        return best_row
+
+    def repair_row(self, i, row):
+        """
+        A row close to the given one for employee i, which breaks none of the
+        constraints the greedy passes keep track of if possible.
+        """
+        employee = self._problem.employees[i]
+
+        for reverse in (False, True):
+            new_row, time_worked = self._fill_row(i, reverse, row)
+
+            if time_worked >= employee.min_total_minutes:
+                return new_row
+
+        return self._generate_row(i)
 
     def generate_population(self, size):
+        if not self._randomize and size > 1:
+            # Without randomizing, every instance comes out the same
+            inst = self.generate_population(1)[0]
+            return [inst] + [inst.copy() for i in xrange(size - 1)]
+
         pops = []
 
         for i in xrange(size):
             inst = ScheduleInstance(self._problem.days, self._problem.employees, self._shift_types)
-            for j in xrange(self._n_employees):
-                result = self._generate_employee_assignments(j, inst)
-
-                if not result: # Try reversed!
-                    self._generate_employee_assignments(j, inst, True)
-
+            inst._matrix[:] = self.generate_rows(1, xrange(self._n_employees))[0]
             pops.append(inst)
 
         return pops
+
+    def generate_rows(self, size, rows):
+        """
+        Just the given rows of size instances, as a (size, rows, days) array.
+        Rows are generated independently, so they can be split up.
+        """
+        matrices = np.zeros((size, len(rows), self._problem.days), dtype=np.int8)
+
+        for k in xrange(size if self._randomize else min(size, 1)):
+            for j, i in enumerate(rows):
+                matrices[k, j] = self._generate_row(i)
+
+        if not self._randomize:
+            matrices[1:] = matrices[:1]
+
+        return matrices
+
+    def unpack_population(self, packed):
+        template = ScheduleInstance(0, [], self._shift_types)
+        return [template._derive(np.array(matrix, dtype=np.int8)) for matrix in packed]
+
+class ScheduleRepairer(Repairer):
+    """
+    Rebuilds the rows of a schedule that break hard constraints with the
+    greedy passes, keeping as much of each row as fits.
+    """
+    def __init__(self, problem):
+        self._gen = GreedySchedulePopulationGenerator(problem)
+        self._eval = ScheduleEvaluator(problem, 0)
+
+    def _maybe_broken_rows(self, inst):
+        if inst._row_hard is None:
+            return xrange(inst._rows)
+
+        return sorted(set(np.flatnonzero(inst._row_hard).tolist()) | inst._dirty_rows)
+
+    def repair(self, inst):
+        repaired = []
+
+        for i in self._maybe_broken_rows(inst):
+            broke_hard, score = self._eval._evaluate_for_employee(inst._matrix[i], i)
+
+            if not broke_hard:
+                continue
+
+            row = np.array(self._gen.repair_row(i, inst._matrix[i].tolist()), dtype=np.int8)
+            changed = np.flatnonzero(row != inst._matrix[i]).tolist()
+
+            inst._writable()
+            inst._matrix[i] = row
+            inst._touch(rows=(i,), cols=changed)
+            repaired.append(i)
+
+        return repaired
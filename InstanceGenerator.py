@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import argparse
+from random import Random
+
+SHIFT_GROUPS = 'edl' # Early, day and late shifts, in the order they start
+DURATIONS = [360, 480, 480, 600]
+COVER_UNDER_WEIGHT = 100
+COVER_OVER_WEIGHT = 1
+
+def count_weekends(row):
+    """
+    Work weekends of a row of shift names, counted the way the evaluator
+    does: every Saturday worked, and Sundays unless following one.
+    """
+    weekends = 0
+    already_worked_this_weekend = False
+
+    for day, shift in enumerate(row):
+        if not shift:
+            continue
+
+        if day % 7 == 5 or (day % 7 == 6 and not already_worked_this_weekend):
+            weekends += 1
+            already_worked_this_weekend = True
+        else:
+            already_worked_this_weekend = False
+
+    return weekends
+
+def make_shifts(rng, n_shifts):
+    """
+    (name, minutes, group) of each shift, spread over the groups. A shift
+    cannot be followed by one of an earlier group.
+    """
+    shifts = []
+
+    for k in xrange(n_shifts):
+        group = k * len(SHIFT_GROUPS) // n_shifts
+        name = '{0}{1}'.format(SHIFT_GROUPS[group], k + 1)
+        shifts.append((name, rng.choice(DURATIONS), group))
+
+    return shifts
+
+def make_days_off(rng, n_days, density):
+    """
+    A vacation of a week or two if the density allows it, the rest of the
+    days off scattered.
+    """
+    n_off = int(round(density * n_days))
+    days_off = set()
+
+    if n_off >= 7:
+        length = min(n_off, rng.choice([7, 14]))
+        start = rng.randint(0, n_days - length)
+        days_off.update(xrange(start, start + length))
+
+    while len(days_off) < n_off:
+        days_off.add(rng.randint(0, n_days - 1))
+
+    return days_off
+
+def make_row(rng, n_days, days_off, allowed, min_consecutive, max_consecutive, min_days_off):
+    """
+    A row of shift names (None when off) made of work runs of min to max
+    consecutive shifts of one shift each, with at least min_days_off days
+    off between them and none on the days off.
+    """
+    row = [None] * n_days
+    day = rng.randint(0, min_days_off) # Leave the start of the horizon a bit loose
+
+    while day < n_days:
+        length = rng.randint(min_consecutive, max_consecutive)
+        free = 0
+
+        while free < length and day + free < n_days and day + free not in days_off:
+            free += 1
+
+        if free >= min_consecutive:
+            shift = rng.choice(allowed)
+
+            for d in xrange(day, day + free):
+                row[d] = shift
+
+            day += free
+
+        # At least min_days_off days off after a run, else try the next day
+        day += min_days_off if free >= min_consecutive else 1
+        day += rng.randint(0, 1)
+
+    return row
+
+def generate(n_employees = 50, n_days = 182, n_shifts = 6, days_off_density = 0.1,
+             on_request_density = 0.15, off_request_density = 0.05, cover_tightness = 1.0,
+             seed = None):
+    """
+    A random instance as a list of (header, data lines) sections, along with
+    a schedule breaking none of its hard constraints, as rows of shift names
+    (None when off). Employee limits and covers are derived from that
+    schedule, covers being met exactly at a cover_tightness of 1 and
+    requiring proportionally more (or less) staff otherwise.
+    """
+    rng = Random(seed)
+    shifts = make_shifts(rng, n_shifts)
+    names = [name for name, minutes, group in shifts]
+    minutes = dict((name, m) for name, m, group in shifts)
+
+    staff = []
+    days_off_lines = []
+    schedule = []
+
+    for i in xrange(n_employees):
+        name = 'E{0}'.format(i)
+        allowed = rng.sample(names, rng.randint(max(1, n_shifts // 2), n_shifts))
+        min_consecutive = rng.randint(1, 2)
+        max_consecutive = rng.randint(max(min_consecutive, 4), 6)
+        min_days_off = rng.randint(1, 2)
+        days_off = make_days_off(rng, n_days, days_off_density)
+
+        row = make_row(rng, n_days, days_off, allowed, min_consecutive, max_consecutive, min_days_off)
+        worked = sum(minutes[shift] for shift in row if shift)
+
+        max_shifts = '|'.join('{0}={1}'.format(shift, n_days if shift in allowed else 0) for shift in names)
+        staff.append(','.join(str(x) for x in [
+            name, max_shifts,
+            worked + rng.randint(0, 2) * max(DURATIONS), # MaxTotalMinutes
+            max(0, worked - rng.randint(0, 2) * max(DURATIONS)), # MinTotalMinutes
+            max_consecutive, min_consecutive, min_days_off,
+            count_weekends(row) + rng.randint(0, 1), # MaxWeekends
+        ]))
+        days_off_lines.append(','.join([name] + [str(day) for day in sorted(days_off)]))
+        schedule.append(row)
+
+    on_requests = []
+    off_requests = []
+
+    for i in xrange(n_employees):
+        for day in xrange(n_days):
+            if rng.random() < on_request_density:
+                on_requests.append('E{0},{1},{2},{3}'.format(i, day, rng.choice(names), rng.randint(1, 3)))
+            if rng.random() < off_request_density:
+                off_requests.append('E{0},{1},{2},{3}'.format(i, day, rng.choice(names), rng.randint(1, 3)))
+
+    cover = []
+
+    for day in xrange(n_days):
+        for shift in names:
+            working = sum(1 for row in schedule if row[day] == shift)
+            cover.append('{0},{1},{2},{3},{4}'.format(day, shift, int(round(working * cover_tightness)),
+                                                      COVER_UNDER_WEIGHT, COVER_OVER_WEIGHT))
+
+    # Later groups cannot be followed by earlier ones
+    shift_lines = []
+
+    for name, m, group in shifts:
+        not_followed_by = [other for other, om, og in shifts if og < group]
+        shift_lines.append('{0},{1},{2}'.format(name, m, '|'.join(not_followed_by)))
+
+    sections = [
+        ('SECTION_HORIZON', [str(n_days)]),
+        ('SECTION_SHIFTS', shift_lines),
+        ('SECTION_STAFF', staff),
+        ('SECTION_DAYS_OFF', days_off_lines),
+        ('SECTION_SHIFT_ON_REQUESTS', on_requests),
+        ('SECTION_SHIFT_OFF_REQUESTS', off_requests),
+        ('SECTION_COVER', cover),
+    ]
+
+    return sections, schedule
+
+def write_sections(path, sections):
+    with open(path, 'w') as fp:
+        for header, lines in sections:
+            fp.write(header + '\n')
+            fp.write(''.join(line + '\n' for line in lines))
+            fp.write('\n')
+
+def write_schedule(path, schedule):
+    """
+    Writes a schedule the way solutions are saved, tab separated shifts.
+    """
+    with open(path, 'w') as fp:
+        fp.write('\n'.join('\t'.join(shift or '' for shift in row) for row in schedule))
+
+def main(argv):
+    arg_parser = argparse.ArgumentParser(description='Writes a random instance with a known feasible schedule.')
+    arg_parser.add_argument('output')
+    arg_parser.add_argument('--employees', type=int, default=50)
+    arg_parser.add_argument('--days', type=int, default=182)
+    arg_parser.add_argument('--shifts', type=int, default=6)
+    arg_parser.add_argument('--days-off', type=float, default=0.1, help='fraction of days off per employee')
+    arg_parser.add_argument('--on-requests', type=float, default=0.15, help='chance of a request to work, per employee and day')
+    arg_parser.add_argument('--off-requests', type=float, default=0.05, help='chance of a request to be off, per employee and day')
+    arg_parser.add_argument('--tightness', type=float, default=1.0, help='cover requirements relative to the feasible schedule')
+    arg_parser.add_argument('--seed', type=int)
+    arg_parser.add_argument('--schedule', help='where to write the feasible schedule')
+    args = arg_parser.parse_args(argv)
+
+    sections, schedule = generate(args.employees, args.days, args.shifts, args.days_off,
+                                  args.on_requests, args.off_requests, args.tightness, args.seed)
+    write_sections(args.output, sections)
+
+    if args.schedule:
+        write_schedule(args.schedule, schedule)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
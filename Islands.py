@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+from multiprocessing import Event, Process, Queue, cpu_count
+from Queue import Empty
+from time import time
+from Stopping import EventStopping
+import random
+
+RING = 'ring'
+FULLY_CONNECTED = 'full'
+
+POLL_INTERVAL = 0.1 # Seconds between checks on the islands
+
+def neighbours(i, n_islands, topology):
+    """
+    Indices of the islands island i sends its migrants to.
+    """
+    if n_islands < 2:
+        return []
+    if topology == RING:
+        return [(i + 1) % n_islands]
+    if topology == FULLY_CONNECTED:
+        return [j for j in xrange(n_islands) if j != i]
+
+    raise ValueError('Unknown topology {0}'.format(topology))
+
+def _drain(queue):
+    items = []
+
+    while True:
+        try:
+            items.append(queue.get_nowait())
+        except Empty:
+            return items
+
+def _run_island(i, ga, seed, pop_size, min_score, max_iter, interval, n_migrants,
+                inbox, outboxes, results, stop):
+    random.seed(seed)
+    ga.checkpoint_path = None # One checkpoint can't hold all the islands
+    ga.stopping = EventStopping(stop, ga.stopping) # Checked every generation
+    ga.reset()
+    pops = ga._pop_gen.generate_population(pop_size)
+    eval_pops = None
+    done_iter = 0
+
+    while done_iter < max_iter:
+        n_iter = min(interval, max_iter - done_iter)
+        # Carries on from the scored population rather than scoring it again
+        eval_pops = ga.evolve(pops, min_score, done_iter + n_iter, done_iter, eval_pops)
+        done_iter += n_iter
+
+        best_score, best = eval_pops[0]
+        results.put((i, best_score, best))
+
+        if best_score <= min_score:
+            stop.set()
+        if ga.stopping.should_stop():
+            break
+
+        # Send our best away and let the arrivals replace our worst
+        for box in outboxes:
+            box.put(eval_pops[:n_migrants])
+
+        # Along with their scores, the same on every island
+        immigrants = [pair for migrants in _drain(inbox) for pair in migrants]
+        immigrants = immigrants[:max(0, len(eval_pops) - n_migrants)]
+
+        if immigrants:
+            eval_pops = sorted(eval_pops[:len(eval_pops) - len(immigrants)] + immigrants, key=lambda x: x[0])
+
+    results.put((i, None, None)) # Done
+
+class IslandModel(object):
+    """
+    Runs a genetic algorithm on several islands, each one a separate process
+    with its own population. Every migration_interval generations an island
+    sends its n_migrants best instances to its neighbours in the topology,
+    and the ones it got replace its worst. Stops once any island gets down
+    to min_score, all of them are done or the time limit runs out.
+    """
+    def __init__(self, ga, n_islands = None, topology = RING, migration_interval = 25, n_migrants = 2):
+        self._ga = ga
+        self.n_islands = n_islands or cpu_count()
+        self.topology = topology
+        self.migration_interval = migration_interval
+        self.n_migrants = n_migrants
+
+    def run(self, pop_size, min_score, max_iter, time_limit = None, seed = None):
+        """
+        Returns the best instance found on any island and its score.
+        """
+        rng = random.Random(seed)
+        inboxes = [Queue() for i in xrange(self.n_islands)]
+        results = Queue()
+        stop = Event()
+        islands = []
+
+        for i in xrange(self.n_islands):
+            outboxes = [inboxes[j] for j in neighbours(i, self.n_islands, self.topology)]
+            args = (i, self._ga, rng.getrandbits(32), pop_size, min_score, max_iter,
+                    self.migration_interval, self.n_migrants, inboxes[i], outboxes, results, stop)
+            islands.append(Process(target=_run_island, args=args))
+
+        for island in islands:
+            island.start()
+
+        deadline = time() + time_limit if time_limit is not None else None
+        best, best_score = None, None
+        finished = set()
+
+        while len(finished) < self.n_islands:
+            if deadline is not None and time() > deadline:
+                stop.set() # Out of time, wait for the islands to wrap up
+
+            try:
+                i, score, inst = results.get(timeout=POLL_INTERVAL)
+            except Empty:
+                pass
+            else:
+                if inst is None:
+                    finished.add(i)
+                elif best_score is None or score < best_score:
+                    best, best_score = inst, score
+
+            # Nobody else will pick up migrants sent to finished islands, and
+            # their senders can't exit until the migrants are out
+            for i in finished:
+                _drain(inboxes[i])
+
+        for island in islands:
+            while island.is_alive():
+                island.join(POLL_INTERVAL)
+
+                for inbox in inboxes:
+                    _drain(inbox)
+
+        return best, best_score
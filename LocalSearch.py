@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+from GABase import Improver
+from random import sample
+
+class HillClimber(Improver):
+    """
+    First improvement hill climbing over random moves, each one scored by
+    the evaluator's evaluate_move. Tries at most max_moves moves.
+    """
+    def __init__(self, evaluator, max_moves = 20):
+        self._eval = evaluator
+        self.max_moves = max_moves
+
+    def improve(self, inst, score):
+        inst = inst.copy()
+        score = self._eval.evaluate(inst)
+        evaluations = 0
+
+        for k in xrange(self.max_moves):
+            cells = inst.random_move()
+
+            if cells is None:
+                continue
+
+            delta, move = self._eval.evaluate_move(inst, cells)
+            evaluations += 1
+
+            if delta < 0:
+                inst = self._eval.apply_move(inst, move)
+                score += delta
+
+        return inst, score, evaluations
+
+class TabuSearch(Improver):
+    """
+    Each step samples sample_size random moves, scored by the evaluator's
+    evaluate_move, and makes the best one, even if it is worse, unless it
+    changes a cell changed in the last tenure steps and does not beat the
+    best score so far. Returns the best instance seen in max_steps steps.
+    """
+    def __init__(self, evaluator, max_steps = 10, sample_size = 5, tenure = 7):
+        self._eval = evaluator
+        self.max_steps = max_steps
+        self.sample_size = sample_size
+        self.tenure = tenure
+
+    def improve(self, inst, score):
+        inst = inst.copy()
+        score = self._eval.evaluate(inst)
+        best, best_score = inst.copy(), score
+        evaluations = 0
+        tabu = {} # (row, col) : step until which it may not change
+
+        for step in xrange(self.max_steps):
+            chosen, chosen_score = None, None
+
+            for k in xrange(self.sample_size):
+                cells = inst.random_move()
+
+                if cells is None:
+                    continue
+
+                delta, move = self._eval.evaluate_move(inst, cells)
+                new_score = score + delta
+                evaluations += 1
+
+                is_tabu = any(tabu.get((row, col), -1) >= step for row, col, code in cells)
+
+                if is_tabu and new_score >= best_score:
+                    continue
+
+                if chosen is None or new_score < chosen_score:
+                    chosen, chosen_move, chosen_score = cells, move, new_score
+
+            if chosen is None:
+                continue
+
+            inst = self._eval.apply_move(inst, chosen_move)
+            score = chosen_score
+
+            for row, col, code in chosen:
+                tabu[(row, col)] = step + self.tenure
+
+            if score < best_score:
+                best, best_score = inst.copy(), score
+
+        return best, best_score, evaluations
+
+class RowDescent(Improver):
+    """
+    Rebuilds the max_rows rows whose breaks cost the most (as explained by
+    the evaluator) with a RowOptimizer, or random rows if fewer break
+    anything, keeping every new row that improves the score.
+    """
+    def __init__(self, evaluator, optimizer, max_rows = 2):
+        self._eval = evaluator
+        self._optimizer = optimizer
+        self.max_rows = max_rows
+
+    def improve(self, inst, score):
+        inst = inst.copy()
+        score = self._eval.evaluate(inst)
+        evaluations = 0
+        costs = {}
+
+        for name, employee, day, shift, weight in self._eval.explain(inst):
+            if employee is not None:
+                costs[employee] = costs.get(employee, 0) + weight
+
+        rows = sorted(costs, key=costs.get, reverse=True)[:self.max_rows]
+        others = [i for i in xrange(inst._rows) if i not in costs]
+        rows += sample(others, min(len(others), self.max_rows - len(rows)))
+
+        for i in rows:
+            undo = self._optimizer.reoptimize(inst, i)
+
+            if undo is None:
+                continue
+
+            new_score = self._eval.evaluate(inst)
+            evaluations += 1
+
+            if new_score < score:
+                score = new_score
+            else:
+                inst._undo(undo)
+
+        return inst, score, evaluations
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import json
+import numpy as np
+from abc import ABCMeta, abstractmethod
+
+class MetricsSink(object):
+    """
+    Where a search records its metrics, a dict per generation. Searches skip
+    gathering them altogether when the sink is not enabled.
+    """
+    __metaclass__ = ABCMeta
+
+    enabled = True
+
+    @abstractmethod
+    def record(self, metrics):
+        pass
+
+    def close(self):
+        pass
+
+class NullSink(MetricsSink):
+    enabled = False
+
+    def record(self, metrics):
+        pass
+
+class MemorySink(MetricsSink):
+    def __init__(self):
+        self.records = []
+
+    def record(self, metrics):
+        self.records.append(metrics)
+
+class JsonlSink(MetricsSink):
+    """
+    Appends every record to a file as a line of JSON.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._fp = open(path, 'a')
+
+    def record(self, metrics):
+        self._fp.write(json.dumps(metrics, sort_keys=True) + '\n')
+        self._fp.flush() # So that it can be followed while the search runs
+
+    def close(self):
+        self._fp.close()
+
+def diversity(packed):
+    """
+    How spread out a population is, from what the pack methods of its
+    instances returned, best first: the mean fraction of the values that
+    differ from those of the best instance, and the number of distinct
+    instances.
+    """
+    stack = np.array(packed).reshape(len(packed), -1)
+    distinct = len(set(row.tobytes() for row in stack))
+
+    return float((stack[1:] != stack[0]).mean()) if len(stack) > 1 else 0.0, distinct
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+from multiprocessing import Pool, cpu_count
+from random import Random, getrandbits
+from GABase import Evaluator, PopulationGenerator
+import numpy as np
+import random
+
+_worker_evaluator = None # The evaluator of this worker process
+_worker_generators = None # Or the population generators it runs
+
+def _init_worker(evaluator):
+    global _worker_evaluator
+    _worker_evaluator = evaluator
+
+def _init_generator(generators):
+    global _worker_generators
+    _worker_generators = generators
+
+def _evaluate_chunk(matrices):
+    return _worker_evaluator._evaluate_population(matrices)
+
+def _generate_chunk(args):
+    k, size, rows, seed = args
+    random.seed(seed)
+    generator = _worker_generators[k]
+
+    if rows is not None:
+        return generator.generate_rows(size, rows)
+
+    return np.array([inst.pack() for inst in generator.generate_population(size)])
+
+def split_chunks(items, n_chunks):
+    """
+    Splits a list into at most n_chunks contiguous, nearly equal parts.
+    """
+    n_chunks = max(1, min(n_chunks, len(items)))
+    size, extra = divmod(len(items), n_chunks)
+    chunks = []
+    start = 0
+
+    for i in xrange(n_chunks):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(items[start:end])
+        start = end
+
+    return chunks
+
+class ParallelEvaluator(Evaluator):
+    """
+    Evaluates populations in chunks over a persistent pool of processes. The
+    wrapped ScheduleEvaluator (and the problem with it) is handed to each
+    worker once when the pool starts. Only the instances it would evaluate
+    from scratch go to the workers, as their matrices, and come back with
+    their cached results filled in, so that their children still get
+    evaluated incrementally. Anything else is done by the wrapped evaluator
+    in this process, along with its fitness cache.
+    """
+    def __init__(self, evaluator, processes = None, chunks_per_process = 1):
+        self._eval = evaluator
+        self._processes = processes or cpu_count()
+        self._n_chunks = self._processes * chunks_per_process
+        self._pool = Pool(self._processes, _init_worker, (evaluator,))
+
+    def __getattr__(self, name):
+        return getattr(self._eval, name)
+
+    def evaluate(self, instance):
+        return self._eval.evaluate(instance)
+
+    def violations(self, instance):
+        return self._eval.violations(instance)
+
+    def evaluate_move(self, instance, move):
+        return self._eval.evaluate_move(instance, move)
+
+    def apply_move(self, instance, move):
+        return self._eval.apply_move(instance, move)
+
+    def evaluate_population(self, instances):
+        """
+        Scores the instances, the same as the serial evaluator.
+        """
+        stale = self._eval._stale_instances(instances)
+
+        if len(stale) < 2:
+            self._eval._refresh(stale)
+        else:
+            chunks = split_chunks(stale, self._n_chunks)
+            matrices = [np.array([inst._matrix for inst in chunk]) for chunk in chunks]
+
+            for chunk, results in zip(chunks, self._pool.map(_evaluate_chunk, matrices)):
+                self._eval._attach(chunk, results)
+
+        return [self._eval.evaluate(inst) for inst in instances]
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+class ParallelPopulationGenerator(PopulationGenerator):
+    """
+    Generates populations in chunks over a pool of processes started for the
+    call. Mixed generators are split into their parts first, so that the
+    population is mixed just like the serial one. A part with fewer
+    instances than there are chunks gets its employees' rows split among
+    the chunks instead, if its generator can generate_rows. Each chunk is
+    generated with the worker's random seeded from seed (drawn from random
+    if None), so the same seed and number of chunks give the same
+    population.
+    """
+    def __init__(self, generator, processes = None, chunks_per_process = 1, seed = None):
+        self._gen = generator
+        self._processes = processes or cpu_count()
+        self._n_chunks = self._processes * chunks_per_process
+        self.seed = seed
+
+    def generate_population(self, size):
+        seeds = Random(self.seed if self.seed is not None else getrandbits(32))
+        parts = self._gen.parts(size)
+        chunks = []
+
+        for k, (generator, part_size) in enumerate(parts):
+            if not part_size:
+                continue
+
+            if part_size < self._n_chunks and hasattr(generator, 'generate_rows'):
+                chunks += [(k, part_size, rows, seeds.getrandbits(32))
+                           for rows in split_chunks(range(generator._n_employees), self._n_chunks)]
+            else:
+                chunks += [(k, len(chunk), None, seeds.getrandbits(32))
+                           for chunk in split_chunks(range(part_size), self._n_chunks)]
+
+        pool = Pool(self._processes, _init_generator, ([generator for generator, part_size in parts],))
+
+        try:
+            packed = pool.map(_generate_chunk, chunks)
+        finally:
+            pool.close()
+            pool.join()
+
+        matrices = []
+
+        for k in xrange(len(parts)):
+            results = [(rows, result) for (part, n, rows, seed), result in zip(chunks, packed) if part == k]
+
+            if results and results[0][0] is not None:
+                # Rows of the same instances, to put back side by side
+                matrices.extend(np.concatenate([result for rows, result in results], axis=1))
+            else:
+                matrices.extend(matrix for rows, result in results for matrix in result)
+
+        return self._gen.unpack_population(matrices)
+
+    def unpack_population(self, packed):
+        return self._gen.unpack_population(packed)
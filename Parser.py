@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-import re
+import ProblemCache
 from Employee import Employee
 from ShiftType import ShiftType
 from Problem import Problem
@@ -77,64 +77,85 @@ def merge_data(data):
         employees[indices[name]].days_off = d_off
 
     # Add employee shift on/off requests
-    for shift in data['shift_on_reqs']:
-        employees[indices[shift[0]]].add_shift_on_request(shifts[1:])
+    for req in data['shift_on_reqs']:
+        employees[indices[req[0]]].add_shift_on_request(req[1:])
 
-    for shift in data['shift_off_reqs']:
-        employees[indices[shift[0]]].add_shift_off_request(shifts[1:])
+    for req in data['shift_off_reqs']:
+        employees[indices[req[0]]].add_shift_off_request(req[1:])
 
-    return Problem(days, section_covers, employees, shifts)
+    return Problem(days, section_covers, employees, shifts).compile()
 
 class Parser(object):
+    """
+    Parses the lines of each section with the block parser registered for its
+    header, in a single pass over the file. The parsed problem is cached next
+    to the file unless use_cache is turned off, as it is once the parsers or
+    the postprocessor are changed, the cache only telling source files apart.
+    """
     def __init__(self):
         self._block_parsers = []
         self._post_process = lambda x : x
-        self._comment_pattern = re.compile('^\s*\#.*$')
 
-        self.add_block_parser('days', day_count_parser)
-        self.add_block_parser('shifts', shifts_parser)
-        self.add_block_parser('staff', staff_parser)
-        self.add_block_parser('days_off', days_off_parser)
-        self.add_block_parser('shift_on_reqs', shift_request_parser)
-        self.add_block_parser('shift_off_reqs', shift_request_parser)
-        self.add_block_parser('section_cover', section_cover_parser)
+        self.add_block_parser('days', day_count_parser, 'SECTION_HORIZON')
+        self.add_block_parser('shifts', shifts_parser, 'SECTION_SHIFTS')
+        self.add_block_parser('staff', staff_parser, 'SECTION_STAFF')
+        self.add_block_parser('days_off', days_off_parser, 'SECTION_DAYS_OFF')
+        self.add_block_parser('shift_on_reqs', shift_request_parser, 'SECTION_SHIFT_ON_REQUESTS')
+        self.add_block_parser('shift_off_reqs', shift_request_parser, 'SECTION_SHIFT_OFF_REQUESTS')
+        self.add_block_parser('section_cover', section_cover_parser, 'SECTION_COVER')
 
         self.set_postprocessor(merge_data)
+        self.use_cache = True # Only for these parsers
 
-    def _is_comment(self, line):
-        return self._comment_pattern.search(line) is not None
+    def _parse_lines(self, lines):
+        results = {}
+        sections = {}
 
-    def _parse_block(self, line_generator, parse):
-        values = []
-        is_title_read = False
+        for name, parser, section in self._block_parsers:
+            results[name] = []
+            sections[section] = (results[name], parser)
 
-        for line in line_generator:
-            if(self._is_comment(line)):
-                continue
+        values, parse = None, None
 
-            if not is_title_read:
-                is_title_read = True
-                continue
+        for line in lines:
+            line = line.strip()
 
-            if not line.strip():
-                break
+            if not line or line[0] == '#':
+                continue
 
-            values.append(parse(line.strip()))
+            if line in sections:
+                values, parse = sections[line]
+            elif line.startswith('SECTION_'): # Not one we know, skip it
+                values, parse = None, None
+            elif parse is not None:
+                values.append(parse(line))
 
-        return line_generator, values
+        return results
 
-    def add_block_parser(self, name, parser):
-        self._block_parsers.append((name, parser))
+    def add_block_parser(self, name, parser, section):
+        self._block_parsers.append((name, parser, section))
+        self.use_cache = False
 
     def set_postprocessor(self, pp):
         self._post_process = pp
+        self.use_cache = False
 
     def parse(self, file_name):
-        f = open(file_name, 'r')
-        results = {}
+        path = ProblemCache.cache_path(file_name)
+
+        if self.use_cache:
+            problem = ProblemCache.load(path, file_name)
+
+            if problem is not None:
+                return problem
+
+        with open(file_name, 'r') as f:
+            problem = self._post_process(self._parse_lines(f))
 
-        for name, parser in self._block_parsers:
-            _, vals = self._parse_block(f, parser)
-            results[name] = vals
+        if self.use_cache and isinstance(problem, Problem):
+            try:
+                ProblemCache.save(path, problem, file_name)
+            except (IOError, OSError):
+                pass # E.g. a read only directory, just parse next time too
 
-        return self._post_process(results)
+        return problem
@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
 
+import numpy as np
+
+OFF = 0 # Shift code of a day off, actual shifts are numbered from 1
+
 class Problem(object):
     """
     A simple problem container
@@ -9,3 +13,82 @@ class Problem(object):
         self.section_covers = section_covers
         self.employees = employees
         self.shifts = shifts
+        self.compiled = False
+
+        # Shift names interned to small integer codes, in order of definition
+        self.shift_names = [''] + [s.name for s in shifts]
+        self.shift_codes = {name : code for code, name in enumerate(self.shift_names)}
+
+    def compile(self):
+        """
+        Builds dense lookup tables of the constraints, indexed by employee,
+        day and shift code. Only done once, returns the problem itself.
+        """
+        if self.compiled:
+            return self
+
+        n_employees = len(self.employees)
+        n_codes = len(self.shift_names)
+        codes = self.shift_codes
+
+        # Shift durations and which shift cannot follow which
+        self.durations = np.zeros(n_codes, dtype=np.int64)
+        self.no_follow = np.zeros((n_codes, n_codes), dtype=bool)
+
+        for shift in self.shifts:
+            self.durations[codes[shift.name]] = shift.time
+
+            for name in shift.not_followed_by:
+                if name and name in codes:
+                    self.no_follow[codes[shift.name], codes[name]] = True
+
+        # Per employee limits, days off and the weights of requests to work or
+        # not to work a shift on a day
+        self.days_off = np.zeros((n_employees, self.days), dtype=bool)
+        self.shift_on_requests = np.zeros((n_employees, self.days, n_codes), dtype=np.int64)
+        self.shift_off_requests = np.zeros((n_employees, self.days, n_codes), dtype=np.int64)
+        self.max_shifts = np.zeros((n_employees, n_codes), dtype=np.int64)
+
+        for i, employee in enumerate(self.employees):
+            for day in employee.days_off:
+                if 0 <= day < self.days:
+                    self.days_off[i, day] = True
+
+            for requests, reqs in ((self.shift_on_requests, employee.get_shift_on_requests()),
+                                   (self.shift_off_requests, employee.get_shift_off_requests())):
+                for day, name, weight in reqs:
+                    if 0 <= day < self.days and name in codes:
+                        requests[i, day, codes[name]] += weight
+
+            for code, name in enumerate(self.shift_names):
+                if code != OFF:
+                    self.max_shifts[i, code] = employee.get_max_shift(name)
+
+        # The penalty of working a shift (or OFF) on a day, which is that of
+        # being off it and that of not working any of the other requested ones
+        self.shift_penalties = self.shift_off_requests + \
+            self.shift_on_requests.sum(axis=2, keepdims=True) - self.shift_on_requests
+
+        self.min_total_minutes = np.array([e.min_total_minutes for e in self.employees], dtype=np.int64)
+        self.max_total_minutes = np.array([e.max_total_minutes for e in self.employees], dtype=np.int64)
+        self.min_consecutive_shifts = np.array([e.min_consecutive_shifts for e in self.employees], dtype=np.int64)
+        self.max_consecutive_shifts = np.array([e.max_consecutive_shifts for e in self.employees], dtype=np.int64)
+        self.min_consecutive_days_off = np.array([e.min_consecutive_days_off for e in self.employees], dtype=np.int64)
+        self.max_weekends = np.array([e.max_weekends for e in self.employees], dtype=np.int64)
+
+        # Cover requirements per day and shift, with no weights where there
+        # is no requirement
+        self.cover_reqs = np.zeros((self.days, n_codes), dtype=np.int64)
+        self.cover_under = np.zeros((self.days, n_codes), dtype=np.int64)
+        self.cover_over = np.zeros((self.days, n_codes), dtype=np.int64)
+
+        for day, covers in self.section_covers.iteritems():
+            for name, req, w_under, w_over in covers:
+                if 0 <= day < self.days and name in codes:
+                    self.cover_reqs[day, codes[name]] = req
+                    self.cover_under[day, codes[name]] = w_under
+                    self.cover_over[day, codes[name]] = w_over
+
+        self.compiled = True
+
+        return self
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import os
+import struct
+import hashlib
+import cPickle as pickle
+import numpy as np
+from Checkpoint import atomic_write
+from Problem import Problem
+
+VERSION = 2 # Bump whenever what gets parsed into a problem changes
+
+ALIGNMENT = 64 # Arrays start at multiples of this many bytes
+HEADER_SIZE = struct.Struct('<Q')
+
+def cache_path(source):
+    return source + '.cache'
+
+def source_stamp(source):
+    st = os.stat(source)
+    return st.st_mtime, st.st_size
+
+def source_digest(source):
+    with open(source, 'rb') as fp:
+        return hashlib.md5(fp.read()).hexdigest()
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+def save(path, problem, source):
+    """
+    Atomically writes a compiled problem, stamped with the source file it was
+    parsed from. Its arrays are written raw after a pickled header, so load
+    can memory map them.
+    """
+    state = {}
+    arrays = []
+    specs = []
+    offset = 0
+
+    for name, value in sorted(vars(problem).iteritems()):
+        if isinstance(value, np.ndarray):
+            value = np.ascontiguousarray(value)
+            arrays.append((offset, value))
+            specs.append((name, value.dtype.str, value.shape, offset))
+            offset = _aligned(offset + value.nbytes)
+        else:
+            state[name] = value
+
+    header = pickle.dumps({'version' : VERSION, 'stamp' : source_stamp(source),
+                           'digest' : source_digest(source), 'state' : state,
+                           'arrays' : specs}, pickle.HIGHEST_PROTOCOL)
+    data_start = _aligned(HEADER_SIZE.size + len(header))
+    data = bytearray(data_start + offset)
+
+    data[:HEADER_SIZE.size] = HEADER_SIZE.pack(len(header))
+    data[HEADER_SIZE.size:HEADER_SIZE.size + len(header)] = header
+
+    for start, value in arrays:
+        start += data_start
+        data[start:start + value.nbytes] = value.tobytes()
+
+    atomic_write(path, bytes(data))
+
+def load(path, source):
+    """
+    The problem saved to path, with read only arrays memory mapped from it.
+    None if there is no readable cache, or the source changed since.
+    """
+    try:
+        with open(path, 'rb') as fp:
+            size, = HEADER_SIZE.unpack(fp.read(HEADER_SIZE.size))
+            header = pickle.loads(fp.read(size))
+    except (IOError, EOFError, ValueError, struct.error, pickle.UnpicklingError):
+        return None
+
+    if header.get('version') != VERSION:
+        return None
+
+    # A touched but unchanged source still has the same contents
+    if header['stamp'] != source_stamp(source) and header['digest'] != source_digest(source):
+        return None
+
+    problem = Problem.__new__(Problem)
+    problem.__dict__.update(header['state'])
+    data_start = _aligned(HEADER_SIZE.size + size)
+    buf = np.memmap(path, dtype=np.uint8, mode='r')
+
+    for name, dtype, shape, offset in header['arrays']:
+        setattr(problem, name, np.ndarray(shape, dtype, buffer=buf, offset=data_start + offset))
+
+    return problem
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from fractions import gcd
+from GAImpl import is_saturday, is_sunday
+from Problem import OFF
+
+MAX_SOLVES = 8 # Dynamic programs run per row while narrowing down the weekend multiplier, once one works
+MULTIPLIER_TOLERANCE = 0.1 # Relative, at which the search settles for the lowest feasible one found
+
+WEEKDAY, SATURDAY, SUNDAY = range(3)
+
+class RowOptimizer(object):
+    """
+    Rebuilds one employee's row as the cheapest one breaking none of their
+    hard constraints, the rest of the schedule staying as it is. A cell
+    costs its shift requests plus cover_pressure times how much it changes
+    the cover score of its day, so at the default of 1 a row's cost is
+    exactly how much it adds to the schedule's score.
+
+    The row is a shortest path over the days through states of (last shift,
+    length of the current streak of shifts or days off, whether it counted
+    as a work weekend), for every number of minutes worked. Consecutive
+    shift limits, shifts that cannot follow others, days off and total
+    minutes are therefore met exactly. Work weekends and shifts over their
+    maximum count are priced with a multiplier, searched for until the row
+    stays within them.
+    """
+    def __init__(self, problem, cover_pressure = 1.0):
+        self._problem = problem
+        self.cover_pressure = cover_pressure
+        self._n_codes = len(problem.shift_names)
+        self._tables = {}
+        self._multipliers = {} # Last feasible one by employee, where the next search starts
+
+    def cell_costs(self, inst, i):
+        """
+        (days, shift codes) costs of the cells of row i.
+        """
+        problem = self._problem
+        n_days = inst._matrix.shape[1]
+        codes = inst._matrix.astype(np.intp)
+
+        # Cover counts of the other rows
+        counts = np.bincount((np.arange(n_days) * self._n_codes + codes).ravel(), minlength=n_days * self._n_codes)
+        counts = counts.reshape(n_days, self._n_codes)
+        counts[np.arange(n_days), codes[i]] -= 1
+
+        def cover_score(counts):
+            return (counts < problem.cover_reqs) * problem.cover_under + \
+                   (counts > problem.cover_reqs) * problem.cover_over
+
+        pressure = cover_score(counts + 1) - cover_score(counts)
+
+        return problem.shift_penalties[i] + self.cover_pressure * pressure
+
+    def optimize(self, inst, i):
+        """
+        The cheapest feasible row i as an array of shift codes, along with its
+        cost, or (None, None) if none was found.
+        """
+        costs = self.cell_costs(inst, i)
+        problem = self._problem
+        max_weekends = problem.max_weekends[i]
+        max_shifts = problem.max_shifts[i]
+
+        best, best_cost = None, None
+        feasible_mu, infeasible_mu = None, None
+        mu = self._multipliers.get(i, 0.0)
+        # Past this a break costs more than all the cells together, so the
+        # row found breaks the limits as little as it can
+        max_mu = np.abs(costs).sum() + 1.0
+        solves = 0
+
+        while solves < MAX_SOLVES:
+            row, weekends = self._solve(i, costs, mu)
+
+            if row is None:
+                break
+
+            counts = np.bincount(row, minlength=self._n_codes)
+
+            if weekends <= max_weekends and (counts[1:] <= max_shifts[1:]).all():
+                cost = costs[np.arange(len(row)), row].sum()
+
+                if best is None or cost < best_cost:
+                    best, best_cost = row, cost
+
+                feasible_mu = mu
+            else:
+                infeasible_mu = mu
+
+            if feasible_mu is None:
+                # Raised for as long as it takes, there being nothing to settle for yet
+                if mu >= max_mu:
+                    break
+
+                mu = min(max_mu, max(1.0, mu * 2))
+                continue
+
+            solves += 1
+
+            if feasible_mu == 0.0:
+                break # Nothing had to be priced in
+            elif infeasible_mu is None:
+                mu = mu / 2 if mu >= 1.0 else 0.0
+            elif feasible_mu - infeasible_mu <= MULTIPLIER_TOLERANCE * feasible_mu:
+                break
+            else:
+                mu = (feasible_mu + infeasible_mu) / 2
+
+        if best is None:
+            return None, None
+
+        self._multipliers[i] = feasible_mu
+
+        return best.astype(np.int8), float(best_cost)
+
+    def reoptimize(self, inst, i):
+        """
+        Replaces row i with the one optimize finds, in place. Returns the undo
+        for inst._undo, or None if it left the row as it was.
+        """
+        row, cost = self.optimize(inst, i)
+
+        if row is None:
+            return None
+
+        changed = np.nonzero(row != inst._matrix[i])[0].tolist()
+
+        if not changed:
+            return None
+
+        return inst._assign([(i, day, int(row[day])) for day in changed])
+
+    def _employee_tables(self, i):
+        """
+        The states of employee i's rows and how they follow each other, by the
+        kind of day and whether it is the last one.
+        """
+        if i in self._tables:
+            return self._tables[i]
+
+        problem = self._problem
+        allowed = [code for code in xrange(1, self._n_codes) if problem.max_shifts[i, code] > 0]
+        min_shifts = problem.min_consecutive_shifts[i]
+        max_streak = max(1, problem.max_consecutive_shifts[i])
+        rest = max(1, problem.min_consecutive_days_off[i]) # Days off after which a shift may follow
+
+        states = [(OFF, k, f) for f in (0, 1) for k in xrange(1, rest + 1)]
+        states += [(code, s, f) for f in (0, 1) for code in allowed for s in xrange(1, max_streak + 1)]
+        index = dict((state, n) for n, state in enumerate(states))
+
+        def sources(dst, kind, last):
+            code, length, flag = dst
+
+            if code == OFF:
+                # Days off carry the weekend flag along
+                srcs = [index[(OFF, k, flag)] for k in xrange(1, rest + 1) if min(k + 1, rest) == length]
+
+                if length == 1:
+                    srcs += [index[(c, s, flag)] for c in allowed for s in xrange(1, max_streak + 1)
+                             if s >= min_shifts]
+
+                return srcs
+
+            # Saturdays always count as a work weekend, Sundays unless the
+            # last shift did, other days never
+            if kind == WEEKDAY:
+                flags = [0, 1] if flag == 0 else []
+            elif kind == SATURDAY:
+                flags = [0, 1] if flag == 1 else []
+            else:
+                flags = [1 - flag]
+
+            if length == 1:
+                return [index[(OFF, k, f)] for f in flags for k in xrange(1, rest + 1) if k == rest or last]
+
+            return [index[(c, length - 1, f)] for f in flags for c in allowed
+                    if not problem.no_follow[c, code]]
+
+        units = reduce(gcd, [int(problem.durations[code]) for code in allowed], 0) or 1
+        transitions = {}
+
+        for kind in (WEEKDAY, SATURDAY, SUNDAY):
+            for last in (False, True):
+                srcs = [sources(state, kind, last) for state in states]
+                width = max(1, max(len(s) for s in srcs))
+                # Padded with a column of infinite cost
+                transitions[(kind, last)] = np.array([s + [len(states)] * (width - len(s)) for s in srcs])
+
+        tables = {
+            'states' : states,
+            'codes' : np.array([code for code, length, flag in states]),
+            'counted' : np.array([code != OFF and flag == 1 for code, length, flag in states]),
+            'start' : index[(OFF, rest, 0)],
+            'shifts' : np.array([int(problem.durations[code]) // units for code, length, flag in states]),
+            'min_units' : -(-int(problem.min_total_minutes[i]) // units),
+            'max_units' : int(problem.max_total_minutes[i]) // units,
+            'transitions' : transitions,
+        }
+        self._tables[i] = tables
+
+        return tables
+
+    def _day_kind(self, day):
+        return SATURDAY if is_saturday(day) else SUNDAY if is_sunday(day) else WEEKDAY
+
+    def _solve(self, i, costs, mu):
+        """
+        The cheapest row meeting all but the weekend and shift count limits,
+        each work weekend costing mu more and every shift of a type over its
+        maximum count mu more too. Returns it with its work weekends, or
+        (None, None) if there is none.
+        """
+        tables = self._employee_tables(i)
+        problem = self._problem
+        n_days = costs.shape[0]
+        n_states = len(tables['states'])
+        n_units = tables['max_units'] + 1
+        codes = tables['codes']
+        shifts = tables['shifts']
+        groups = [(u, np.nonzero(shifts == u)[0]) for u in np.unique(shifts)]
+        most = shifts.max()
+
+        # Shift types that may be worked fewer times than there are days get
+        # priced in along with the weekends
+        limited = problem.max_shifts[i] < n_days
+        limited[OFF] = False
+        day_costs = costs[:, codes] + mu * (tables['counted'] + limited[codes])
+        day_costs[problem.days_off[i][:, None] & (codes != OFF)] = np.inf
+
+        value = np.full((n_units, n_states + 1), np.inf)
+        value[0, tables['start']] = 0.0
+        values = [] # Before each day, to trace the path back
+
+        for day in xrange(n_days):
+            srcs = tables['transitions'][(self._day_kind(day), day == n_days - 1)]
+
+            # Only the units that could have been worked by now, and still
+            # leave enough days to get to the minimum
+            lo = max(0, tables['min_units'] - (n_days - day) * most)
+            hi = min(n_units, day * most + 1)
+
+            if lo >= hi:
+                return None, None
+
+            values.append(value)
+            best = value[lo:hi, srcs].min(axis=2) # Over the sources of each state
+            cost = day_costs[day]
+            new_value = np.full((n_units, n_states + 1), np.inf)
+
+            for u, cols in groups:
+                end = min(n_units, hi + u)
+
+                if end > lo + u:
+                    new_value[lo + u:end, cols] = best[:end - lo - u, cols] + cost[cols]
+
+            value = new_value
+
+        value = value[tables['min_units']:, :n_states]
+
+        if not value.size or not np.isfinite(value).any():
+            return None, None
+
+        units, state = np.unravel_index(value.argmin(), value.shape)
+        units += tables['min_units']
+        row = np.zeros(n_days, dtype=np.intp)
+        weekends = 0
+
+        for day in xrange(n_days - 1, -1, -1):
+            row[day] = codes[state]
+            weekends += tables['counted'][state]
+            units -= shifts[state]
+            srcs = tables['transitions'][(self._day_kind(day), day == n_days - 1)][state]
+            state = srcs[values[day][units, srcs].argmin()]
+
+        return row, weekends
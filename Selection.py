@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+from abc import ABCMeta, abstractmethod
+from bisect import bisect_right
+from random import random, randint
+
+class Selection(object):
+    """
+    Picks parents out of a generation. prepare is called once per generation
+    with its (score, instance) pairs, best (lowest score) first, and select
+    once per parent.
+    """
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def prepare(self, eval_pops):
+        pass
+
+    @abstractmethod
+    def select(self):
+        pass
+
+class CumulativeSelection(Selection):
+    """
+    Selects proportionally to weights, by binary search over their prefix sums.
+    """
+    __metaclass__ = ABCMeta
+
+    def __init__(self):
+        self._pops = []
+        self._sums = []
+
+    @abstractmethod
+    def _weights(self, eval_pops):
+        pass
+
+    def prepare(self, eval_pops):
+        self._pops = [pop for score, pop in eval_pops]
+        self._sums = []
+        curr_sum = 0
+
+        for weight in self._weights(eval_pops):
+            curr_sum += weight
+            self._sums.append(curr_sum)
+
+    def select(self):
+        i = bisect_right(self._sums, random() * self._sums[-1])
+        return self._pops[min(i, len(self._pops) - 1)]
+
+class RouletteSelection(CumulativeSelection):
+    """
+    Fitness proportional, with the fitness being the inverse of the score.
+    """
+    def _weights(self, eval_pops):
+        return [1.0 / max(score, 1) for score, pop in eval_pops]
+
+class RankSelection(CumulativeSelection):
+    """
+    Linear ranking. The best gets pressure times the average weight, the
+    worst 2 - pressure times it, pressure being between 1 and 2.
+    """
+    def __init__(self, pressure = 1.5):
+        CumulativeSelection.__init__(self)
+        self.pressure = pressure
+
+    def _weights(self, eval_pops):
+        n = len(eval_pops)
+
+        if n < 2:
+            return [1.0] * n
+
+        step = 2.0 * (self.pressure - 1) / (n - 1)
+        return [self.pressure - step * rank for rank in xrange(n)]
+
+class TournamentSelection(Selection):
+    """
+    Best of size instances drawn at random, with replacement.
+    """
+    def __init__(self, size = 2):
+        self.size = size
+        self._pops = []
+
+    def prepare(self, eval_pops):
+        self._pops = [pop for score, pop in eval_pops]
+
+    def select(self):
+        # The pairs are sorted, so the lowest index wins
+        n = len(self._pops)
+        return self._pops[min(randint(0, n - 1) for i in xrange(self.size))]
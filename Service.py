@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import random
+import traceback
+import numpy as np
+from glob import glob
+from time import time, sleep
+from multiprocessing import Pool
+from Parser import Parser
+from GAImpl import ScheduleEvaluator
+from Metrics import JsonlSink
+from Archive import SolutionArchive
+import ProblemCache
+import Solver
+
+POLL_INTERVAL = 0.5 # Seconds between looks into the spool directory
+JOB_OPTIONS = ['pop_size', 'min_score', 'max_iter', 'time_limit', 'seed_fraction', 'engine'] # Settings a job may override
+
+_problems = {} # Path : (source stamp, problem, evaluator), kept by each worker between jobs
+
+def instance_files(directory):
+    return sorted(glob(os.path.join(directory, '*.txt')))
+
+def _init_worker():
+    # Forked workers would otherwise all start from the same random state
+    random.seed()
+    np.random.seed()
+
+def _load(path):
+    """
+    The problem parsed from path, and an evaluator for it, reused for as long
+    as the file does not change.
+    """
+    stamp = ProblemCache.source_stamp(path)
+
+    if path not in _problems or _problems[path][0] != stamp:
+        problem = Parser().parse(path)
+        _problems[path] = (stamp, problem, ScheduleEvaluator(problem))
+
+    return _problems[path][1:]
+
+def solve_file(args):
+    """
+    Solves the instance file in a worker, appending its metrics to
+    progress_path if given. Returns what came of it as a dictionary.
+    """
+    path, output, options, progress_path = args
+    name = os.path.splitext(os.path.basename(path))[0] + '-res'
+    archive = SolutionArchive(output)
+    started = time()
+    metrics = None
+
+    try:
+        problem, evaluator = _load(path)
+        metrics = JsonlSink(progress_path) if progress_path else None
+        solution, score, feasible = Solver.solve(problem, archive, name, evaluator=evaluator, metrics=metrics, **options)
+    except Exception:
+        return {'instance' : path, 'status' : 'failed', 'error' : traceback.format_exc(),
+                'seconds' : time() - started}
+    finally:
+        if metrics is not None:
+            metrics.close()
+
+    return {
+        'instance' : path,
+        'status' : 'done',
+        'score' : int(score),
+        'feasible' : feasible,
+        'solution' : archive.save(problem, solution, score, name) if feasible else None,
+        'seconds' : time() - started,
+    }
+
+def batch(paths, output, workers = None, options = {}):
+    """
+    Solves the instance files over a pool of workers, with any of
+    JOB_OPTIONS, printing a line for each one as it finishes. Returns their
+    results in the order they came.
+    """
+    pool = Pool(workers, _init_worker)
+    results = []
+
+    try:
+        for result in pool.imap_unordered(solve_file, [(path, output, options, None) for path in paths]):
+            results.append(result)
+
+            if result['status'] == 'done':
+                print '{0}: score {1}, feasible {2}, {3:.1f} s'.format(result['instance'], result['score'],
+                                                                       result['feasible'], result['seconds'])
+            else:
+                print '{0}: failed\n{1}'.format(result['instance'], result['error'])
+    finally:
+        pool.close()
+        pool.join()
+
+    return results
+
+def _finish(spool, job, result):
+    with open(os.path.join(spool, 'results', job + '.jsonl'), 'a') as fp:
+        fp.write(json.dumps(result, sort_keys=True) + '\n')
+
+    os.remove(os.path.join(spool, 'running', job + '.json'))
+
+def serve(spool, output, workers = None, options = {}, poll_interval = POLL_INTERVAL):
+    """
+    Solves the jobs dropped into spool/jobs over a pool of workers, until a
+    file named stop shows up in the spool directory. A job is a .json file
+    of an object with the instance path and any of JOB_OPTIONS, overriding
+    those given here. Drop it in atomically, e.g. by renaming it into place.
+    It moves to spool/running while it is being solved. Its metrics are
+    streamed to spool/results/<job>.jsonl, a line per generation, the last
+    line being its result, the one with a status.
+
+    The workers stay up between jobs, along with the problems they parsed.
+    """
+    for name in ('jobs', 'running', 'results'):
+        if not os.path.isdir(os.path.join(spool, name)):
+            os.makedirs(os.path.join(spool, name))
+
+    pool = Pool(workers, _init_worker)
+    pending = {}
+
+    try:
+        while not os.path.exists(os.path.join(spool, 'stop')):
+            for name in sorted(os.listdir(os.path.join(spool, 'jobs'))):
+                if not name.endswith('.json'):
+                    continue
+
+                job = name[:-len('.json')]
+                path = os.path.join(spool, 'running', name)
+                os.rename(os.path.join(spool, 'jobs', name), path)
+
+                try:
+                    with open(path, 'r') as fp:
+                        spec = json.load(fp)
+
+                    job_options = dict(options, **dict((key, spec[key]) for key in JOB_OPTIONS if key in spec))
+                    args = (spec['instance'], output, job_options, os.path.join(spool, 'results', job + '.jsonl'))
+                except (ValueError, KeyError, TypeError) as e:
+                    _finish(spool, job, {'status' : 'failed', 'error' : 'bad job: {0!r}'.format(e)})
+                    continue
+
+                pending[job] = pool.apply_async(solve_file, (args,))
+
+            for job, result in pending.items():
+                if result.ready():
+                    _finish(spool, job, result.get())
+                    del pending[job]
+
+            sleep(poll_interval)
+    finally:
+        pool.close()
+        pool.join()
+
+        for job, result in pending.items():
+            _finish(spool, job, result.get())
+
+    os.remove(os.path.join(spool, 'stop'))
@@ -1,33 +1,189 @@
 # -*- coding: utf-8 -*-
 
+import os
+import sys
+import argparse
 from Parser import Parser
 from GABase import GeneticAlgorithm
-from GAImpl import ScheduleEvaluator, MixedPopulationGenerator
+from GAImpl import ScheduleEvaluator, MixedPopulationGenerator, ScheduleRepairer, MUTATIONS, N_MUTATIONS, P_MUTATION
+from Parallel import ParallelEvaluator, ParallelPopulationGenerator
+from Islands import IslandModel
+from Stopping import StoppingCriteria
+from LocalSearch import HillClimber, RowDescent
+from RowOptimizer import RowOptimizer
+from Metrics import JsonlSink
+from Adaptive import OperatorControl
+from Archive import SolutionArchive, SeededPopulationGenerator
+from Trajectory import SimulatedAnnealing, LateAcceptance
 
 POP_SIZE = 100
-MAX_ITER = 1000
+MAX_ITER = 1000 # Generations, or blocks of moves for the single solution searches
 MIN_ERR = 5000
+N_PROCESSES = None # Generate and evaluate populations over this many processes if set
+N_ISLANDS = None # Evolve this many populations in separate processes if set
+TIME_LIMIT = None # Seconds
+MAX_EVALUATIONS = None
+MAX_STAGNATION = None # Generations without improvement
+CHECKPOINT_PATH = None # Checkpoint the run here if set, and resume from it if it exists
+CHECKPOINT_EVERY = 10 # Seconds
+LOCAL_SEARCH_MOVES = None # Hill climb the elites for this many moves a generation if set
+ROW_DESCENT_ROWS = None # Rebuild this many rows of each elite a generation if set, instead of hill climbing
+REPAIR_RATE = None # Repair this fraction of the children if set
+ADAPTIVE = False # Adapt the kinds and amount of mutation to how well they do
+SEED_FRACTION = None # Start this fraction of the population from the best archived schedules if set
+ARCHIVE_EXTRA = ['res-last.txt'] # Schedules to seed from besides those in the output directory
+METRICS_PATH = None # Append a line of JSON metrics per generation here if set
+PRINT_EVERY = 25 # Generations between progress lines when solving a single instance
+ENGINE = 'ga' # Or a single solution search, 'sa' (simulated annealing) or 'lahc' (late acceptance)
+TRAJECTORIES = {'sa' : SimulatedAnnealing, 'lahc' : LateAcceptance}
 
 def marker(d):
     if d != 0 and (d % 7 == 5 or d % 7 == 6):
         return 'W'
     return '-'
 
-p = Parser()
-problem = p.parse('instance.txt')
+def make_ga(problem, pop_gen, evaluator, time_limit = TIME_LIMIT):
+    """
+    A genetic algorithm set up as configured above.
+    """
+    ga = GeneticAlgorithm(pop_gen, evaluator)
+    ga.stopping = StoppingCriteria(time_limit, MAX_EVALUATIONS, MAX_STAGNATION)
+    ga.checkpoint_every = CHECKPOINT_EVERY
 
-pop_gen = MixedPopulationGenerator(problem)
-evaluator = ScheduleEvaluator(problem)
+    if ROW_DESCENT_ROWS:
+        ga.improver = RowDescent(evaluator, RowOptimizer(problem), ROW_DESCENT_ROWS)
+    elif LOCAL_SEARCH_MOVES:
+        ga.improver = HillClimber(evaluator, LOCAL_SEARCH_MOVES)
 
-ga = GeneticAlgorithm(pop_gen, evaluator)
-ga.print_every = 25
+    if REPAIR_RATE:
+        ga.repairer = ScheduleRepairer(problem)
+        ga.repair_rate = REPAIR_RATE
 
-for i in xrange(1):
-    solution, score = ga.run(POP_SIZE, MIN_ERR, MAX_ITER)
-    is_feasible = evaluator.is_feasible(solution)
+    if ADAPTIVE:
+        ga.control = OperatorControl(MUTATIONS, N_MUTATIONS, P_MUTATION)
+
+    return ga
+
+def make_search(problem, engine, pop_gen, evaluator, time_limit = TIME_LIMIT):
+    """
+    The search engine named, the genetic algorithm or one of TRAJECTORIES,
+    set up as configured above.
+    """
+    if engine == 'ga':
+        return make_ga(problem, pop_gen, evaluator, time_limit)
+
+    search = TRAJECTORIES[engine](pop_gen, evaluator)
+    search.stopping = StoppingCriteria(time_limit, MAX_EVALUATIONS, MAX_STAGNATION)
+
+    return search
+
+def solve(problem, archive, name = 'res', pop_size = POP_SIZE, min_score = MIN_ERR, max_iter = MAX_ITER,
+          time_limit = TIME_LIMIT, seed_fraction = SEED_FRACTION, evaluator = None, metrics = None,
+          print_every = None, checkpoint_path = None, parallel = False, engine = ENGINE):
+    """
+    Solves the problem, keeping its best feasible solution so far saved to
+    the archive under name along the way (one file per island), and
+    starting from the best schedules already there if seed_fraction is set.
+    Only spawns processes (for N_PROCESSES or N_ISLANDS) if parallel, which
+    it cannot be from within a worker process. Only the genetic algorithm
+    checkpoints and runs on islands, the single solution searches scoring
+    their moves with the serial evaluator. The islands, being processes
+    already, evolve serially too.
+    Returns the solution, its score and whether it is feasible.
+    """
+    pop_gen = MixedPopulationGenerator(problem)
+    evaluator = evaluator or ScheduleEvaluator(problem)
+    serial_evaluator = evaluator
+    islands = engine == 'ga' and parallel and N_ISLANDS
+
+    if parallel and N_PROCESSES and not islands:
+        pop_gen = ParallelPopulationGenerator(pop_gen, N_PROCESSES)
+        evaluator = ParallelEvaluator(evaluator, N_PROCESSES)
+
+    if seed_fraction:
+        pop_gen = SeededPopulationGenerator(pop_gen, archive.schedules(problem, serial_evaluator), seed_fraction)
+
+    saved = [] # The file of the best feasible solution so far, replaced by every better one
+
+    def save_if_feasible(solution, score):
+        if serial_evaluator.is_feasible(solution):
+            path = archive.save(problem, solution, score, name)
+
+            for old in saved:
+                if old != path:
+                    try:
+                        os.remove(old)
+                    except OSError:
+                        pass
+
+            saved[:] = [path]
+
+    search = make_search(problem, engine, pop_gen, evaluator if engine == 'ga' else serial_evaluator, time_limit)
+    search.print_every = print_every
+    search.on_improvement = save_if_feasible # Keep progress in case the run gets killed
+    search.metrics = metrics
+
+    if engine == 'ga':
+        search.checkpoint_path = checkpoint_path
+
+    try:
+        if islands:
+            solution, score = IslandModel(search, N_ISLANDS).run(pop_size, min_score, max_iter, time_limit)
+        elif engine == 'ga' and checkpoint_path and os.path.exists(checkpoint_path):
+            solution, score = search.resume(checkpoint_path, min_score, max_iter)
+        else:
+            solution, score = search.run(pop_size, min_score, max_iter)
+    finally:
+        if evaluator is not serial_evaluator:
+            evaluator.close()
+
+    return solution, score, serial_evaluator.is_feasible(solution)
+
+def main(argv):
+    arg_parser = argparse.ArgumentParser(description='Solves shift scheduling instances.')
+    arg_parser.add_argument('instance', nargs='?', default='instance.txt')
+    arg_parser.add_argument('--batch', metavar='DIR', help='solve every .txt instance in the directory instead')
+    arg_parser.add_argument('--serve', metavar='SPOOL', help='solve the jobs dropped into the spool directory until stopped')
+    arg_parser.add_argument('--workers', type=int, help='instances solved at once in batch or service mode, one per core by default')
+    arg_parser.add_argument('--output', default='solutions', help='the solution archive, where to save solutions')
+    arg_parser.add_argument('--pop-size', type=int, default=POP_SIZE)
+    arg_parser.add_argument('--max-iter', type=int, default=MAX_ITER)
+    arg_parser.add_argument('--min-score', type=int, default=MIN_ERR)
+    arg_parser.add_argument('--time-limit', type=float, default=TIME_LIMIT, help='seconds per instance')
+    arg_parser.add_argument('--seed-fraction', type=float, default=SEED_FRACTION,
+                            help='fraction of the population started from the best archived schedules')
+    arg_parser.add_argument('--engine', choices=['ga'] + sorted(TRAJECTORIES), default=ENGINE,
+                            help='the genetic algorithm, simulated annealing or late acceptance hill climbing')
+    args = arg_parser.parse_args(argv)
+
+    options = {'pop_size' : args.pop_size, 'max_iter' : args.max_iter, 'min_score' : args.min_score,
+               'time_limit' : args.time_limit, 'seed_fraction' : args.seed_fraction, 'engine' : args.engine}
+
+    if args.batch or args.serve:
+        import Service
+
+        if args.serve:
+            Service.serve(args.serve, args.output, args.workers, options)
+            return 0
+
+        results = Service.batch(Service.instance_files(args.batch), args.output, args.workers, options)
+        return 0 if all(result['status'] == 'done' for result in results) else 1
+
+    problem = Parser().parse(args.instance)
+    archive = SolutionArchive(args.output, ARCHIVE_EXTRA)
+    metrics = JsonlSink(METRICS_PATH) if METRICS_PATH else None
+    solution, score, is_feasible = solve(problem, archive, metrics=metrics, print_every=PRINT_EVERY,
+                                         checkpoint_path=CHECKPOINT_PATH, parallel=True, **options)
+
+    if metrics is not None:
+        metrics.close()
 
     print 'Final score', score, 'Feasible?', is_feasible
 
     if is_feasible:
-        with open('solutions/res-' + str(score) + '.txt', 'w') as fp:
-            fp.write(str(solution))
+        archive.save(problem, solution, score)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+from time import time
+
+class StoppingCriteria(object):
+    """
+    Stops a search on a wall clock time limit (in seconds), after a number of
+    evaluations or after a number of iterations without improvement. Any of
+    them left as None is not checked.
+    """
+    def __init__(self, time_limit = None, max_evaluations = None, max_stagnation = None):
+        self.time_limit = time_limit
+        self.max_evaluations = max_evaluations
+        self.max_stagnation = max_stagnation
+        self.start()
+
+    def start(self):
+        self.started = time()
+        self.evaluations = 0
+        self.stagnation = 0
+        self.best_score = None
+
+    def elapsed(self):
+        return time() - self.started
+
+    def get_state(self):
+        return (self.elapsed(), self.evaluations, self.stagnation, self.best_score)
+
+    def set_state(self, state):
+        """
+        Carries on from a get_state, e.g. when resuming from a checkpoint.
+        """
+        elapsed, self.evaluations, self.stagnation, self.best_score = state
+        self.started = time() - elapsed
+
+    def update(self, best_score, evaluations):
+        """
+        Records an iteration of the search. Returns whether it improved.
+        """
+        self.evaluations += evaluations
+
+        if self.best_score is None or best_score < self.best_score:
+            self.best_score = best_score
+            self.stagnation = 0
+            return True
+
+        self.stagnation += 1
+        return False
+
+    def should_stop(self):
+        """
+        The reason the search should stop, or None if it should go on.
+        """
+        if self.time_limit is not None and self.elapsed() >= self.time_limit:
+            return 'time limit'
+        if self.max_evaluations is not None and self.evaluations >= self.max_evaluations:
+            return 'evaluation budget'
+        if self.max_stagnation is not None and self.stagnation >= self.max_stagnation:
+            return 'stagnation'
+
+        return None
+
+class EventStopping(object):
+    """
+    Stops a search as soon as an event gets set, e.g. by another process,
+    as well as whenever the wrapped stopping criteria say so.
+    """
+    def __init__(self, event, stopping = None):
+        self._event = event
+        self._stopping = stopping or StoppingCriteria()
+
+    def __getattr__(self, name):
+        return getattr(self._stopping, name)
+
+    def should_stop(self):
+        if self._event.is_set():
+            return 'stopped'
+
+        return self._stopping.should_stop()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+from abc import ABCMeta, abstractmethod
+from math import exp
+from random import random
+from time import time
+
+BLOCK_SIZE = 1000 # Moves between checks of the stopping criteria, callbacks and metrics
+INITIAL_TEMPERATURE = 100.0 # Well below the hard constraint penalty, so hard breaks get undone early
+FINAL_TEMPERATURE = 1.0
+HISTORY_LENGTH = 50 # Scores late acceptance compares with, longer ones only pay off in long runs
+
+class TrajectorySearch(object):
+    """
+    Improves a single instance with a long run of its random moves, each
+    scored by the evaluator's evaluate_move (for schedules, over just the
+    rows and days it changes) and made or not as subclasses decide. Takes
+    the same stopping criteria, on_improvement callback and metrics sink as
+    the genetic algorithm, checked and recorded every block of block_size
+    moves, a block counting as one of its iterations.
+    """
+    __metaclass__ = ABCMeta
+
+    def __init__(self, pop_gen, evaluator):
+        self._pop_gen = pop_gen
+        self._eval = evaluator
+        self.print_every = None # Blocks
+        self.stopping = None # StoppingCriteria, checked every block
+        self.on_improvement = None # Called with every new best instance and its score, at most once a block
+        self.metrics = None # MetricsSink recording every block
+        self.block_size = BLOCK_SIZE
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the best score so far and restarts the stopping criteria.
+        """
+        self.best_score = None
+        self.stop_reason = None
+
+        if self.stopping is not None:
+            self.stopping.start()
+
+    def run(self, pop_size, min_score, max_iter):
+        """
+        Searches from the best of pop_size generated instances, like the
+        genetic algorithm's run. Returns the best instance found and its score.
+        """
+        self.reset()
+        pops = self._pop_gen.generate_population(pop_size)
+        score, inst = min(zip(self._eval.evaluate_population(pops), pops), key=lambda x: x[0])
+
+        return self.search(inst, score, min_score, max_iter)
+
+    def search(self, inst, score, min_score, max_iter):
+        """
+        Moves from inst, leaving it be, for up to max_iter blocks, until the
+        best score gets down to min_score or the stopping criteria say so.
+        Returns the best instance found and its score.
+        """
+        evaluator = self._eval
+        inst = inst.copy()
+        best, best_score = inst.copy(), score
+        self.stop_reason = 'max iterations'
+
+        recording = self.metrics is not None and self.metrics.enabled
+        self._start(inst, score)
+
+        for i in xrange(max_iter):
+            started = time()
+            moves = accepted = 0
+
+            for k in xrange(self.block_size):
+                move = inst.random_move()
+
+                if move is None:
+                    continue
+
+                delta, move = evaluator.evaluate_move(inst, move)
+                moves += 1
+
+                if self._accept(score, score + delta):
+                    inst = evaluator.apply_move(inst, move)
+                    score += delta
+                    accepted += 1
+
+                    if score < best_score:
+                        best, best_score = inst.copy(), score
+
+            improved = self.best_score is None or best_score < self.best_score
+
+            if recording:
+                self._record_metrics(i, moves, accepted, score, best, best_score, time() - started)
+
+            if improved:
+                self.best_score = best_score
+
+                if self.on_improvement is not None:
+                    self.on_improvement(best, best_score)
+
+            if self.stopping is not None:
+                self.stopping.update(best_score, moves)
+
+            if self.print_every is not None and i % self.print_every == 0:
+                print 'Iteration {0}, best score {1}, current score {2}'.format(i, best_score, score)
+
+            if best_score <= min_score:
+                self.stop_reason = 'min score'
+                break
+
+            reason = self.stopping.should_stop() if self.stopping is not None else None
+
+            if reason is not None:
+                self.stop_reason = reason
+                break
+
+            self._end_block(self._progress(i + 1, max_iter))
+
+        return best, best_score
+
+    def _progress(self, blocks, max_iter):
+        """
+        How far along the search is, from 0 to 1, by whichever comes first of
+        max_iter blocks and the time limit.
+        """
+        progress = float(blocks) / max_iter
+
+        if self.stopping is not None and self.stopping.time_limit:
+            progress = max(progress, self.stopping.elapsed() / self.stopping.time_limit)
+
+        return min(1.0, progress)
+
+    def _record_metrics(self, i, moves, accepted, score, best, best_score, seconds):
+        metrics = {
+            'iteration' : i,
+            'evaluations' : moves,
+            'best' : float(best_score),
+            'current' : float(score),
+            'acceptance' : float(accepted) / moves if moves else 0.0,
+            'best_violations' : self._eval.violations(best),
+            'block_time' : seconds,
+        }
+        metrics.update(self._stats())
+
+        self.metrics.record(metrics)
+
+    def _start(self, inst, score):
+        pass
+
+    @abstractmethod
+    def _accept(self, score, new_score):
+        """
+        Whether to move from an instance scoring score to one scoring new_score.
+        """
+        pass
+
+    def _end_block(self, progress):
+        pass
+
+    def _stats(self):
+        return {}
+
+class SimulatedAnnealing(TrajectorySearch):
+    """
+    Makes every move that does not worsen the score, and worsening ones
+    with chance exp(-worsening / temperature). The temperature cools
+    geometrically from initial_temperature to final_temperature over the
+    search, as measured by _progress.
+    """
+    def __init__(self, pop_gen, evaluator, initial_temperature = INITIAL_TEMPERATURE,
+                 final_temperature = FINAL_TEMPERATURE):
+        super(SimulatedAnnealing, self).__init__(pop_gen, evaluator)
+        self.initial_temperature = initial_temperature
+        self.final_temperature = final_temperature
+        self.temperature = None
+
+    def _start(self, inst, score):
+        self.temperature = float(self.initial_temperature)
+
+    def _accept(self, score, new_score):
+        return new_score <= score or random() < exp((score - new_score) / self.temperature)
+
+    def _end_block(self, progress):
+        self.temperature = self.initial_temperature * (self.final_temperature / self.initial_temperature) ** progress
+
+    def _stats(self):
+        return {'temperature' : self.temperature}
+
+class LateAcceptance(TrajectorySearch):
+    """
+    Late acceptance hill climbing: makes a move if it does not worsen the
+    score, or if the new score is no worse than the one history_length moves
+    ago. Needs no tuning beyond the length.
+    """
+    def __init__(self, pop_gen, evaluator, history_length = HISTORY_LENGTH):
+        super(LateAcceptance, self).__init__(pop_gen, evaluator)
+        self.history_length = history_length
+
+    def _start(self, inst, score):
+        self._history = [score] * self.history_length
+        self._step = 0
+
+    def _accept(self, score, new_score):
+        k = self._step % self.history_length
+        self._step += 1
+        accepted = new_score <= score or new_score <= self._history[k]
+        self._history[k] = new_score if accepted else score
+
+        return accepted
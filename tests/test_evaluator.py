@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import random
+import unittest
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+from Parser import Parser
+from GAImpl import ScheduleEvaluator, MixedPopulationGenerator
+
+class EvaluatorTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.problem = Parser().parse(os.path.join(ROOT, 'instance.txt'))
+
+    def setUp(self):
+        random.seed(1)
+        np.random.seed(1)
+        self.evaluator = ScheduleEvaluator(self.problem, 0)
+        self.pops = MixedPopulationGenerator(self.problem).generate_population(20)
+
+    def fresh_score(self, inst):
+        """
+        The score of a fresh instance with the same matrix, evaluated
+        from scratch by a fresh evaluator.
+        """
+        return ScheduleEvaluator(self.problem, 0).evaluate(inst._derive(inst._matrix.copy()))
+
+    def random_schedules(self, n):
+        rng = np.random.RandomState(2)
+        template = self.pops[0]
+
+        return [template._derive(rng.randint(0, len(self.problem.shift_names), size=template._matrix.shape)
+                                 .astype(np.int8)) for k in xrange(n)]
+
+    def test_population_scores_match_single_evaluations(self):
+        pops = self.pops + self.random_schedules(10)
+        scores = self.evaluator.evaluate_population(pops)
+
+        self.assertEqual(scores, [self.fresh_score(inst) for inst in pops])
+        self.assertEqual(scores, [self.evaluator.evaluate(inst) for inst in pops])
+
+    def test_population_scores_match_across_chunks(self):
+        import GAImpl
+
+        pops = self.random_schedules(7)
+        scores = ScheduleEvaluator(self.problem, 0).evaluate_population(pops)
+        chunk = GAImpl.REFRESH_CHUNK
+
+        try:
+            GAImpl.REFRESH_CHUNK = 3
+            self.assertEqual(ScheduleEvaluator(self.problem, 0).evaluate_population(self.random_schedules(7)), scores)
+        finally:
+            GAImpl.REFRESH_CHUNK = chunk
+
+    def test_cached_population_scores_match(self):
+        evaluator = ScheduleEvaluator(self.problem)
+        scores = evaluator.evaluate_population(self.pops)
+
+        self.assertEqual(evaluator.evaluate_population(self.pops), scores)
+        self.assertEqual(evaluator.evaluate_population([inst.copy() for inst in self.pops]), scores)
+
+    def test_incremental_scores_after_cross_and_mutate(self):
+        evaluator = self.evaluator
+        evaluator.evaluate_population(self.pops)
+
+        for k in xrange(200):
+            parent_a, parent_b = random.sample(self.pops, 2)
+            child = parent_a.cross(parent_b).mutate(n_mutations=3, p_mutation=0.5)
+
+            self.assertEqual(evaluator.evaluate(child), self.fresh_score(child))
+            self.pops[random.randrange(len(self.pops))] = child
+
+        # The parents keep their own scores
+        for inst in self.pops:
+            self.assertEqual(evaluator.evaluate(inst), self.fresh_score(inst))
+
+    def test_incremental_scores_after_assign_and_undo(self):
+        evaluator = self.evaluator
+        inst = self.pops[0].copy()
+        score = evaluator.evaluate(inst)
+
+        for k in xrange(200):
+            move = inst.random_move()
+
+            if move is None:
+                continue
+
+            undo = inst._assign(move)
+            self.assertEqual(evaluator.evaluate(inst), self.fresh_score(inst))
+
+            if k % 2:
+                inst._undo(undo)
+                self.assertEqual(evaluator.evaluate(inst), score)
+            else:
+                score = evaluator.evaluate(inst)
+
+        self.assertEqual(evaluator.evaluate(self.pops[0]), self.fresh_score(self.pops[0]))
+
+    def test_evaluated_moves_match_made_moves(self):
+        evaluator = self.evaluator
+        inst = self.pops[0].copy()
+        score = evaluator.evaluate(inst)
+
+        for k in xrange(200):
+            move = inst.random_move()
+
+            if move is None:
+                continue
+
+            delta, move = evaluator.evaluate_move(inst, move)
+            moved = inst.copy()
+            moved._assign(move[0])
+            self.assertEqual(self.fresh_score(moved), score + delta)
+
+            if k % 2:
+                inst = evaluator.apply_move(inst, move)
+                score += delta
+                self.assertEqual(evaluator.evaluate(inst), score)
+
+if __name__ == '__main__':
+    unittest.main()
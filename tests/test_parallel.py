@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import random
+import unittest
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+from Parser import Parser
+from GAImpl import ScheduleEvaluator, MixedPopulationGenerator
+from Parallel import ParallelEvaluator, split_chunks
+
+class ParallelEvaluatorTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.problem = Parser().parse(os.path.join(ROOT, 'instance.txt'))
+        cls.parallel = ParallelEvaluator(ScheduleEvaluator(cls.problem, 0), 2, 2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.parallel.close()
+
+    def setUp(self):
+        random.seed(1)
+        np.random.seed(1)
+
+    def population(self, size):
+        return MixedPopulationGenerator(self.problem).generate_population(size)
+
+    def test_scores_match_serial_evaluator(self):
+        pops = self.population(30)
+        serial = ScheduleEvaluator(self.problem, 0).evaluate_population([pop.copy() for pop in pops])
+
+        self.assertEqual(self.parallel.evaluate_population(pops), serial)
+
+    def test_children_match_serial_evaluator(self):
+        # Scored in the workers, the parents must still rescore their children incrementally
+        pops = self.population(20)
+        self.parallel.evaluate_population(pops)
+        children = [random.choice(pops).cross(random.choice(pops)).mutate() for k in xrange(20)]
+        serial = [ScheduleEvaluator(self.problem, 0).evaluate(child._derive(child._matrix.copy()))
+                  for child in children]
+
+        self.assertEqual(self.parallel.evaluate_population(children), serial)
+        self.assertEqual([self.parallel.evaluate(child) for child in children], serial)
+
+    def test_split_chunks(self):
+        self.assertEqual(split_chunks(range(7), 3), [[0, 1, 2], [3, 4], [5, 6]])
+        self.assertEqual(split_chunks(range(2), 4), [[0], [1]])
+        self.assertEqual(split_chunks([], 4), [[]])
+
+if __name__ == '__main__':
+    unittest.main()
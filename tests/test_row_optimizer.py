@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+from Parser import Parser
+from GAImpl import ScheduleEvaluator, ScheduleInstance, GreedySchedulePopulationGenerator
+from RowOptimizer import RowOptimizer
+
+class RowOptimizerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.problem = Parser().parse(os.path.join(ROOT, 'instance.txt'))
+        cls.evaluator = ScheduleEvaluator(cls.problem, 0)
+
+    def load(self, name):
+        problem = self.problem
+        matrix = np.zeros((len(problem.employees), problem.days), dtype=np.int8)
+
+        with open(os.path.join(ROOT, 'solutions', name), 'r') as fp:
+            rows = [line.rstrip('\r').split('\t') for line in fp.read().split('\n') if line.strip()]
+
+        for i, row in enumerate(rows):
+            matrix[i, :len(row)] = [problem.shift_codes[name] for name in row]
+
+        return ScheduleInstance(0, [], [shift.name for shift in problem.shifts])._derive(matrix)
+
+    def assert_feasible_rows_found(self, inst, optimizer):
+        for i in xrange(inst._rows):
+            if self.evaluator._evaluate_for_employee(inst._matrix[i], i)[0]:
+                continue # No feasible row known
+
+            row, cost = optimizer.optimize(inst, i)
+
+            self.assertIsNotNone(row, 'row {0}'.format(i))
+            self.assertEqual(self.evaluator._evaluate_for_employee(row, i)[0], 0, 'row {0}'.format(i))
+
+    def test_rows_with_a_feasible_solution_are_found(self):
+        inst = self.load('res-1-huzjak-skukan.txt')
+        optimizer = RowOptimizer(self.problem)
+
+        self.assert_feasible_rows_found(inst, optimizer)
+        # Again, starting from the multipliers found
+        self.assert_feasible_rows_found(inst, optimizer)
+
+    def test_greedy_rows_with_a_feasible_solution_are_found(self):
+        inst = GreedySchedulePopulationGenerator(self.problem).generate_population(1)[0]
+        self.assert_feasible_rows_found(inst, RowOptimizer(self.problem))
+
+    def test_reoptimized_rows_cost_what_the_score_changes_by(self):
+        inst = self.load('res-1-huzjak-skukan.txt')
+        optimizer = RowOptimizer(self.problem)
+
+        for i in (10, 20, 30):
+            before = self.evaluator.evaluate(inst)
+            row, cost = optimizer.optimize(inst, i)
+            old_cost = optimizer.cell_costs(inst, i)[np.arange(len(row)), inst._matrix[i].astype(np.intp)].sum()
+            self.assertIsNotNone(optimizer.reoptimize(inst, i))
+            self.assertAlmostEqual(self.evaluator.evaluate(inst) - before, cost - old_cost)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+from Parser import Parser
+from GAImpl import ScheduleEvaluator
+from Archive import SolutionArchive
+import Solver
+
+class SolverTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.problem = Parser().parse(os.path.join(ROOT, 'instance.txt'))
+
+    def setUp(self):
+        random.seed(1)
+        self.directory = tempfile.mkdtemp()
+        self.archive = SolutionArchive(self.directory)
+        self.settings = (Solver.N_PROCESSES, Solver.N_ISLANDS)
+
+    def tearDown(self):
+        Solver.N_PROCESSES, Solver.N_ISLANDS = self.settings
+        shutil.rmtree(self.directory)
+
+    def test_islands_with_processes(self):
+        Solver.N_PROCESSES, Solver.N_ISLANDS = 2, 2
+        solution, score, is_feasible = Solver.solve(self.problem, self.archive, pop_size=20, min_score=0,
+                                                    max_iter=4, parallel=True)
+
+        self.assertEqual(ScheduleEvaluator(self.problem).evaluate(solution), score)
+
+if __name__ == '__main__':
+    unittest.main()